@@ -0,0 +1,151 @@
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from array import array
+
+from benchmarks.generator import generate_columns, write_file
+from car_counter import CarCounter
+
+BASELINE = os.path.join(os.path.dirname(__file__), "baseline.json")
+"""
+Default baseline file.
+"""
+
+DEFAULT_SIZES = (1000, 10000, 100000)
+"""
+Default numbers of records.
+"""
+
+
+def stages(size: int, directory: str) -> dict:
+    """
+    Build the benchmarked stages for a number of records
+
+    :param size: number of records
+    :param directory: a directory for the generated input file
+    :return: mapping stage name -> function to measure.
+        Each function starts from a fresh state, so nothing is reused between stages nor repetitions.
+    """
+    timestamps, counts = generate_columns(size)
+    path = os.path.join(directory, f"records_{size}.txt")
+    write_file(path, timestamps, counts)
+    # Unsorted columns for the construction stage
+    order = list(range(size))
+    random.Random(0).shuffle(order)
+    shuffled = (array("q", map(timestamps.__getitem__, order)), array("q", map(counts.__getitem__, order)))
+
+    def fresh() -> CarCounter:
+        # A new counter has empty caches, and no stage changes the columns: they are shared, not copied
+        return CarCounter.from_sorted_columns(timestamps, counts)
+
+    return {
+        "parse": lambda: CarCounter.from_file(path),
+        "construction": lambda: CarCounter.from_columns(*shuffled),
+        "total_count": lambda: fresh().get_total_count(),
+        "count_by_date": lambda: fresh().get_count_by_date(),
+        "top_n": lambda: fresh().get_top_n(3),
+        "least_period": lambda: fresh().get_least_period(3),
+    }
+
+
+def measure(function, repeat: int) -> dict:
+    """
+    Measure a function: best wall time over several runs, and peak memory (in a separate run, as tracing is slow)
+
+    :param function: the function to measure
+    :param repeat: number of timed runs
+    :return: a dict with the 'seconds' and 'peak_bytes'
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    function()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"seconds": best, "peak_bytes": peak}
+
+
+def run(sizes, repeat: int) -> dict:
+    """
+    Run the benchmark
+
+    :param sizes: numbers of records
+    :param repeat: number of timed runs per stage
+    :return: the results: mapping number of records (as a string) -> stage -> measures
+    """
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for size in sizes:
+            results[str(size)] = {}
+            for stage, function in stages(size, directory).items():
+                results[str(size)][stage] = measure(function, repeat)
+                print(f"{size:>10} {stage:<15} {results[str(size)][stage]['seconds']:10.4f} s "
+                      f"{results[str(size)][stage]['peak_bytes'] / 2 ** 20:10.2f} MiB", file=sys.stderr)
+    return results
+
+
+def regressions(results: dict, baseline: dict, threshold: float, min_seconds: float) -> list[str]:
+    """
+    Compare results with a baseline
+
+    :param results: the results of run
+    :param baseline: results of a previous run
+    :param threshold: a stage regresses when its time or peak memory exceeds the baseline times this factor
+    :param min_seconds: time differences below this are noise, and never regressions
+    :return: the description of the regressions
+    """
+    found = []
+    for size, stage_results in results.items():
+        for stage, measures in stage_results.items():
+            reference = baseline.get(size, {}).get(stage)
+            if reference is None:
+                continue
+            seconds, reference_seconds = measures["seconds"], reference["seconds"]
+            if seconds > reference_seconds * threshold and seconds - reference_seconds > min_seconds:
+                found.append(f"{stage} ({size} records): {seconds:.4f} s, baseline {reference_seconds:.4f} s")
+            peak, reference_peak = measures["peak_bytes"], reference["peak_bytes"]
+            if peak > reference_peak * threshold and peak - reference_peak > 2 ** 16:
+                found.append(f"{stage} ({size} records): {peak} bytes, baseline {reference_peak} bytes")
+    return found
+
+
+def main(argv: list[str]) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark of the CarCounter stages")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="numbers of records")
+    parser.add_argument("--repeat", type=int, default=5, help="number of timed runs per stage (default: 5)")
+    parser.add_argument("--baseline", default=BASELINE, help="baseline file (default: benchmarks/baseline.json)")
+    parser.add_argument("--save", action="store_true", help="write the results as the new baseline")
+    parser.add_argument("--threshold", type=float, default=2.0,
+                        help="regression factor over the baseline, for time and memory (default: 2.0)")
+    parser.add_argument("--min-seconds", type=float, default=0.005,
+                        help="time differences ignored as noise (default: 0.005)")
+    args = parser.parse_args(argv)
+
+    results = run(args.sizes, args.repeat)
+    if args.save:
+        with open(args.baseline, "w") as file:
+            json.dump({"python": platform.python_version(), "machine": platform.machine(), "results": results},
+                      file, indent=2)
+        return 0
+    if not os.path.exists(args.baseline):
+        print(f"No baseline {args.baseline}: run with --save to create it", file=sys.stderr)
+        return 0
+    with open(args.baseline) as file:
+        baseline = json.load(file)["results"]
+    found = regressions(results, baseline, args.threshold, args.min_seconds)
+    for regression in found:
+        print(f"Regression: {regression}", file=sys.stderr)
+    return 1 if found else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,80 @@
+import datetime
+import math
+import random
+from array import array
+
+from car_counter import Record, from_seconds, to_seconds
+
+DISTRIBUTIONS = ("uniform", "traffic")
+"""
+Distributions of the generated car counts:
+uniform between 0 and max_count, or following a daily traffic profile (quiet nights, morning and evening peaks).
+"""
+
+
+def generate_columns(size: int, start: datetime.datetime = datetime.datetime(2016, 1, 1),
+                     resolution: datetime.timedelta = datetime.timedelta(minutes=30),
+                     gap_density: float = 0.01, tie_density: float = 0.1,
+                     distribution: str = "traffic", max_count: int = 100, seed: int = 0) -> tuple[array, array]:
+    """
+    Generate synthetic records, sorted by timestamp
+
+    :param size: number of records
+    :param start: timestamp of the first record
+    :param resolution: time between two contiguous records
+    :param gap_density: probability for a record to be followed by a gap (of 1 to 48 missing records)
+    :param tie_density: probability for a count to repeat one of the previous counts, creating ties
+    :param distribution: distribution of the counts, see DISTRIBUTIONS
+    :param max_count: the largest count
+    :param seed: seed of the random generator, the same parameters giving the same records
+    :return: the columns (timestamps in seconds since the epoch, counts)
+    """
+    if distribution not in DISTRIBUTIONS:
+        raise ValueError(f"Unknown distribution {distribution!r}, expected one of {DISTRIBUTIONS}")
+    rng = random.Random(seed)
+    step = int(resolution.total_seconds())
+    timestamps = array("q")
+    counts = array("q")
+    timestamp = to_seconds(start)
+    previous: list[int] = []  # A few recent counts, to create ties
+    for _ in range(size):
+        if previous and rng.random() < tie_density:
+            count = rng.choice(previous)
+        elif distribution == "uniform":
+            count = rng.randint(0, max_count)
+        else:
+            # Two peaks, at 8:00 and 18:00, over a quiet night
+            hour = (timestamp % 86400) / 3600
+            profile = 0.1 + 0.9 * max(math.exp(-((hour - 8) / 2) ** 2), math.exp(-((hour - 18) / 2.5) ** 2))
+            count = min(max_count, max(0, round(rng.gauss(profile * max_count, max_count / 20))))
+        previous = (previous + [count])[-16:]
+        timestamps.append(timestamp)
+        counts.append(count)
+        timestamp += step
+        if rng.random() < gap_density:
+            timestamp += step * rng.randint(1, 48)
+    return timestamps, counts
+
+
+def generate_records(size: int, **parameters) -> list[Record]:
+    """
+    Generate synthetic records, sorted by timestamp (see generate_columns for the parameters)
+
+    :param size: number of records
+    :return: a list of Records
+    """
+    timestamps, counts = generate_columns(size, **parameters)
+    return [Record.from_seconds(timestamp, count) for timestamp, count in zip(timestamps, counts)]
+
+
+def write_file(path, timestamps, counts):
+    """
+    Write records in the input format, one 'YYYY-MM-DDThh:mm:ss n' per line
+
+    :param path: path to the file
+    :param timestamps: timestamps in seconds since the epoch
+    :param counts: counts aligned with the timestamps
+    """
+    with open(path, "w") as file:
+        for timestamp, count in zip(timestamps, counts):
+            file.write(f"{from_seconds(timestamp).isoformat()} {count}\n")
@@ -1,12 +1,89 @@
+import bz2
 import datetime
-from functools import reduce
+import gzip
+import lzma
+import mmap
+import os
+import struct
+import sys
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from collections.abc import Sequence
+from functools import partial, reduce
+from heapq import merge, nlargest, nsmallest
+from itertools import accumulate, compress, islice, repeat
+from operator import attrgetter, eq, floordiv, ge, gt, itemgetter, le, ne, sub
+from typing import Iterable, Iterator
+
+from profiling import profiled
+
+SECONDS_PER_DAY = 86400
+"""
+Number of seconds in a day, used to bucket epoch timestamps by date.
+"""
+
+_EPOCH = datetime.datetime(1970, 1, 1)
+_EPOCH_ORDINAL = _EPOCH.toordinal()
+_ONE_SECOND = datetime.timedelta(seconds=1)
+
+
+def to_seconds(timestamp: datetime.datetime) -> int:
+    """
+    Convert a datetime into a number of seconds since 1970-01-01T00:00:00
+
+    :param timestamp: The datetime to convert. Sub-second precision is dropped.
+           An aware datetime is taken at its own wall-clock time (its time zone is dropped),
+           so that it keeps its date, as the grouping by date of records expects.
+    :return: The number of seconds since the epoch
+    """
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.replace(tzinfo=None)
+    return (timestamp - _EPOCH) // _ONE_SECOND
+
+
+def from_seconds(seconds: int) -> datetime.datetime:
+    """
+    Convert a number of seconds since 1970-01-01T00:00:00 back into a (naive) datetime
+
+    :param seconds: The number of seconds since the epoch
+    :return: The corresponding datetime
+    """
+    return _EPOCH + datetime.timedelta(seconds=seconds)
+
+
+def day_to_string(day: int) -> str:
+    """
+    Convert a day number (seconds since the epoch // SECONDS_PER_DAY) into a 'YYYY-MM-DD' string
+
+    :param day: The number of days since the epoch
+    :return: The date as a string
+    """
+    return str(datetime.date.fromordinal(_EPOCH_ORDINAL + day))
+
+
+_DATE_SECONDS: dict[str, int] = {}
+"""
+Cache of Record.from_string: 'YYYY-MM-DD' date -> seconds since the epoch at the start of the day.
+"""
+
+_TIME_SECONDS: dict[str, int] = {}
+"""
+Cache of Record.from_string: 'Thh:mm:ss' time -> seconds since midnight.
+"""
 
 
 class Record:
     """
     A Record associating a timestamp with a car counter.
+    The timestamp is stored as a number of seconds since the epoch (see to_seconds), which the counters use,
+    and the datetime object is only built when the timestamp attribute is read.
+    A datetime given to the record is kept as is (sub-seconds and time zone included) for its timestamp attribute,
+    its string and comparisons.
     """
 
+    __slots__ = ("_seconds", "car_count", "_timestamp")
+
     def __init__(self, timestamp: datetime.datetime, car_count: int):
         """
         Record constructor
@@ -17,6 +94,38 @@ class Record:
         self.timestamp = timestamp
         self.car_count = car_count
 
+    @classmethod
+    def from_seconds(cls, seconds: int, car_count: int) -> "Record":
+        """
+        Create a record without building its datetime
+
+        :param seconds: When this record has been taken, in seconds since the epoch
+        :param car_count: The car count associated to this record
+        :return: a Record object
+        """
+        record = object.__new__(cls)
+        record._seconds = seconds
+        record.car_count = car_count
+        record._timestamp = None
+        return record
+
+    @property
+    def seconds(self) -> int:
+        """ The timestamp, in seconds since the epoch """
+        return self._seconds
+
+    @property
+    def timestamp(self) -> datetime.datetime:
+        """ The timestamp, built on the first access """
+        if self._timestamp is None:
+            self._timestamp = _EPOCH + datetime.timedelta(seconds=self._seconds)
+        return self._timestamp
+
+    @timestamp.setter
+    def timestamp(self, timestamp: datetime.datetime):
+        self._seconds = to_seconds(timestamp)
+        self._timestamp = timestamp
+
     @staticmethod
     def parse_string(string: str) -> tuple[datetime.datetime, int]:
         """
@@ -33,12 +142,35 @@ class Record:
     @staticmethod
     def from_string(string: str):
         """
-        Create a record from a string representation
+        Create a record from a string representation.
+        The timestamp is converted into seconds without building a datetime, the dates and times being cached
+        (a record 'YYYY-MM-DDThh:mm:ss n' only builds a datetime for the first record of a date or a time).
 
         :param string: The input string with the expected format 'YYYY-MM-DDThh:mm:ss n' where n is the car count
         :return: a Record object
         """
-        return Record(*Record.parse_string(string))
+        s = string.split(" ")
+        field = s[0]
+        day = _DATE_SECONDS.get(field[:10])
+        time = _TIME_SECONDS.get(field[10:])
+        if day is None or time is None:
+            return Record._from_new_string(string)
+        record = object.__new__(Record)
+        record._seconds = day + time
+        record.car_count = int(s[1])
+        record._timestamp = None
+        return record
+
+    @staticmethod
+    def _from_new_string(string: str):
+        """ from_string for a date or a time not cached yet, or another ISO 8601 format """
+        timestamp, count = Record.parse_string(string)
+        field = string.split(" ")[0]
+        if len(field) == 19 and field[10] == "T" and timestamp.tzinfo is None:
+            day = timestamp.replace(hour=0, minute=0, second=0)
+            _DATE_SECONDS[field[:10]] = to_seconds(day)
+            _TIME_SECONDS[field[10:]] = to_seconds(timestamp) - to_seconds(day)
+        return Record(timestamp, count)
 
     def __str__(self):
         return str(self.timestamp.date()) + "T" + str(self.timestamp.time()) + " " + str(self.car_count)
@@ -48,28 +180,745 @@ class Record:
 
     def __eq__(self, other):
         if isinstance(other, Record):
-            return self.timestamp == other.timestamp and self.car_count == other.car_count
+            if self.car_count != other.car_count:
+                return False
+            if self._timestamp is None and other._timestamp is None:
+                return self._seconds == other._seconds
+            # Datetimes given with sub-seconds or a time zone
+            return self.timestamp == other.timestamp
         else:
             return NotImplemented
 
 
+READ_CHUNK_SIZE = 1 << 20
+"""
+Size (in bytes) of the chunks read by the bulk parser.
+"""
+
+
+CACHE_MAGIC = b"CARCOUNT"
+"""
+First bytes of the binary cache files written by CarCounter.save.
+"""
+
+CACHE_VERSION = 2
+"""
+Version of the binary cache format.
+"""
+
+# magic, version, reserved, resolution (s), record count, day count, source size and modification time (ns)
+_CACHE_HEADER = struct.Struct("<8sIIqqqqq")
+
+
+COMPRESSIONS = {
+    "gzip": (b"\x1f\x8b", gzip.open),
+    "bz2": (b"BZh", bz2.open),
+    "xz": (b"\xfd7zXZ\x00", lzma.open),
+}
+"""
+Compressed input formats: name -> (magic bytes starting the files, function opening them).
+"""
+
+
+def compression_of(path) -> str | None:
+    """
+    Detect whether a file is compressed, from its first bytes
+
+    :param path: path to the file
+    :return: the name of the compression (see COMPRESSIONS), None if the file is not compressed
+    """
+    with open(path, "rb") as file:
+        start = file.read(8)
+    for name, (magic, _) in COMPRESSIONS.items():
+        if start.startswith(magic):
+            return name
+    return None
+
+
+def open_input(path):
+    """
+    Open an input file for reading bytes. Compressed files (see COMPRESSIONS) are decompressed while being read,
+    without any temporary file.
+
+    :param path: path to the file
+    :return: a binary file object
+    """
+    compression = compression_of(path)
+    if compression is None:
+        return open(path, "rb")
+    return COMPRESSIONS[compression][1](path, "rb")
+
+
+def read_chunks(file, chunk_size: int = READ_CHUNK_SIZE) -> Iterator[bytes]:
+    """
+    Read a binary file object by chunks
+
+    :param file: a binary file object
+    :param chunk_size: the size of the chunks
+    :return: an iterator over the chunks, until the end of the file
+    """
+    return iter(lambda: file.read(chunk_size), b"")
+
+
+class ColumnParser:
+    """
+    Bulk parser turning lines 'YYYY-MM-DDThh:mm:ss n' into a timestamp column (in seconds since the epoch)
+    and a count column, without creating a datetime per line.
+
+    The fixed-width date and time fields are looked up in caches: as a counter produces many records per day,
+    a date (or a time of the day) is only parsed and validated once.
+    Lines which do not follow the fixed-width layout are given to Record.parse_string.
+    """
+
+    def __init__(self):
+        self.timestamps = array("q")
+        """ Parsed timestamps, in seconds since the epoch """
+        self.counts = array("q")
+        """ Parsed car counts """
+        self._days: dict[bytes, int] = {}  # 'YYYY-MM-DD' -> seconds since the epoch at midnight
+        self._times: dict[bytes, int] = {}  # 'hh:mm:ss' -> seconds since midnight
+        self._pending = b""  # Incomplete last line of the previous chunk
+
+    def _parse_day(self, field: bytes) -> int:
+        if field[4:5] != b"-" or field[7:8] != b"-":
+            raise ValueError(f"Invalid date {field!r}")
+        date = datetime.date.fromisoformat(field.decode())
+        seconds = (date.toordinal() - _EPOCH_ORDINAL) * SECONDS_PER_DAY
+        self._days[field] = seconds
+        return seconds
+
+    def _parse_time(self, field: bytes) -> int:
+        if field[2:3] != b":" or field[5:6] != b":":
+            raise ValueError(f"Invalid time {field!r}")
+        time = datetime.time.fromisoformat(field.decode())
+        seconds = time.hour * 3600 + time.minute * 60 + time.second
+        self._times[field] = seconds
+        return seconds
+
+    def parse_line(self, line: bytes):
+        """
+        Parse one line and append it to the columns
+
+        :param line: a line with the format 'YYYY-MM-DDThh:mm:ss n', with or without its end of line
+        """
+        try:
+            if line[10:11] != b"T" or line[19:20] != b" ":
+                raise ValueError
+            day = line[0:10]
+            time = line[11:19]
+            days = self._days
+            times = self._times
+            timestamp = (days[day] if day in days else self._parse_day(day)) + \
+                        (times[time] if time in times else self._parse_time(time))
+            count = int(line[20:])
+        except ValueError:
+            # Not the fixed-width layout: use the general parser (which raises on malformed lines)
+            dt, count = Record.parse_string(line.decode())
+            timestamp = to_seconds(dt)
+        self.timestamps.append(timestamp)
+        self.counts.append(count)
+
+    def feed(self, chunk: bytes):
+        """
+        Parse a chunk of the input. The chunk does not have to end on a line boundary.
+
+        :param chunk: a chunk of bytes
+        """
+        lines = chunk.split(b"\n")
+        lines[0] = self._pending + lines[0]
+        self._pending = lines.pop()
+
+        # Inlined version of parse_line for the common case
+        days = self._days
+        times = self._times
+        append_timestamp = self.timestamps.append
+        append_count = self.counts.append
+        for line in lines:
+            try:
+                if line[10:11] != b"T" or line[19:20] != b" ":
+                    raise ValueError
+                count = int(line[20:])
+                timestamp = days[line[0:10]] + times[line[11:19]]
+            except (KeyError, ValueError):
+                # New date or time, or not the fixed-width layout
+                self.parse_line(line)
+                continue
+            append_timestamp(timestamp)
+            append_count(count)
+
+    @property
+    def pending(self) -> bytes:
+        """ The incomplete last line fed so far, only parsed by close """
+        return self._pending
+
+    def close(self) -> tuple[array, array]:
+        """
+        Parse the last line, if it was not terminated by an end of line
+
+        :return: the tuple of columns (timestamps, counts), in the order of the input
+        """
+        if self._pending.strip():
+            self.parse_line(self._pending)
+        self._pending = b""
+        return self.timestamps, self.counts
+
+    @staticmethod
+    @profiled("parse", records=lambda args, columns: len(columns[0]))
+    def parse_chunks(chunks: Iterable[bytes]) -> tuple[array, array]:
+        """
+        Parse a whole input given by chunks
+
+        :param chunks: the chunks of bytes of the input
+        :return: the tuple of columns (timestamps, counts), in the order of the input
+        """
+        parser = ColumnParser()
+        for chunk in chunks:
+            parser.feed(chunk)
+        return parser.close()
+
+
+ROLLUP_LEVELS = ("hour", "day", "week", "month")
+"""
+Levels of the pre-aggregated rollups of a CarCounter (see CarCounter.rollup). Weeks start on Monday.
+"""
+
+
+def _hour_bounds(timestamp: int) -> tuple[int, int]:
+    start = timestamp - timestamp % 3600
+    return start, start + 3600
+
+
+def _day_bounds(timestamp: int) -> tuple[int, int]:
+    start = timestamp - timestamp % SECONDS_PER_DAY
+    return start, start + SECONDS_PER_DAY
+
+
+def _week_bounds(timestamp: int) -> tuple[int, int]:
+    day = timestamp // SECONDS_PER_DAY
+    monday = day - (day + 3) % 7  # 1970-01-01 is a Thursday
+    return monday * SECONDS_PER_DAY, (monday + 7) * SECONDS_PER_DAY
+
+
+def _month_bounds(timestamp: int) -> tuple[int, int]:
+    date = datetime.date.fromordinal(_EPOCH_ORDINAL + timestamp // SECONDS_PER_DAY)
+    first = date.replace(day=1)
+    if first.month == 12:
+        following = first.replace(year=first.year + 1, month=1)
+    else:
+        following = first.replace(month=first.month + 1)
+    return (first.toordinal() - _EPOCH_ORDINAL) * SECONDS_PER_DAY, \
+        (following.toordinal() - _EPOCH_ORDINAL) * SECONDS_PER_DAY
+
+
+_ROLLUP_BOUNDS = {"hour": _hour_bounds, "day": _day_bounds, "week": _week_bounds, "month": _month_bounds}
+_ROLLUP_SOURCES = {"week": "day", "month": "day"}  # Rollups built from another rollup rather than from the records
+_ROLLUP_LABELS = {
+    "hour": lambda start: from_seconds(start).isoformat(),
+    "day": lambda start: day_to_string(start // SECONDS_PER_DAY),
+    "week": lambda start: day_to_string(start // SECONDS_PER_DAY),
+    "month": lambda start: day_to_string(start // SECONDS_PER_DAY)[:7],
+}
+
+
+def _aggregate(timestamps, counts, bounds) -> tuple[array, array]:
+    """
+    Add the counts of sorted timestamps falling in the same bucket
+
+    :param timestamps: sorted timestamps, in seconds since the epoch
+    :param counts: counts aligned with the timestamps
+    :param bounds: function giving the (start, end) of the bucket of a timestamp
+    :return: the columns (bucket starts, bucket counts) of the non-empty buckets
+    """
+    starts = array("q")
+    sums = array("q")
+    index = 0
+    while index < len(timestamps):
+        start, end = bounds(timestamps[index])
+        stop = bisect_left(timestamps, end, index)
+        starts.append(start)
+        sums.append(sum(counts[index:stop]))
+        index = stop
+    return starts, sums
+
+
+QUERY_CACHE_SIZE = 128
+"""
+Number of query answers memoized by a CarCounter (see CarCounter.get_top_n), the least recently used being dropped.
+"""
+
+DUPLICATE_POLICIES = ("keep", "replace", "ignore", "sum", "error")
+"""
+What CarCounter.add_records does with a record whose timestamp is already known:
+keep both records (the existing one first), replace the existing record, ignore the new record,
+add its count to the existing record, or raise a ValueError.
+"""
+
+
+_SECONDS = attrgetter("seconds")
+
+
+def _ranges(starts: Iterable[int], size: int) -> Iterator[tuple[int, int]]:
+    """
+    Index ranges of consecutive groups
+
+    :param starts: the start indexes of the groups but the first one (which starts at 0), in increasing order
+    :param size: the number of items
+    :return: an iterator of tuples (start index, stop index) covering [0, size[, empty if size is 0
+    """
+    if size == 0:
+        return
+    start = 0
+    for stop in starts:
+        yield start, stop
+        start = stop
+    yield start, size
+
+
+class RecordsView(Sequence):
+    """
+    Read-only view over a range of the columns of a CarCounter.
+    The records are created on access: the view does not copy the columns.
+    """
+
+    def __init__(self, timestamps, counts, start: int, stop: int):
+        """
+        RecordsView constructor
+
+        :param timestamps: the timestamps column of the viewed counter
+        :param counts: the counts column of the viewed counter
+        :param start: index of the first record of the view
+        :param stop: index after the last record of the view
+        """
+        self._timestamps = timestamps
+        self._counts = counts
+        self._start = start
+        self._stop = stop
+
+    def __len__(self):
+        return self._stop - self._start
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                return [self[i] for i in range(start, stop, step)]
+            return RecordsView(self._timestamps, self._counts, self._start + start, self._start + max(start, stop))
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("RecordsView index out of range")
+        return Record.from_seconds(self._timestamps[self._start + index], self._counts[self._start + index])
+
+    def __repr__(self):
+        return f"RecordsView({list(self)})"
+
+
 class CarCounter:
     """
-    Car Counter over periods of time represented by a list of records
+    Car Counter over periods of time, stored as two sorted columns:
+    the timestamps (seconds since the epoch) and the associated car counts.
     """
 
     time_resolution: datetime.timedelta = datetime.timedelta(minutes=30)
     """
-    Hard coded time resolution (30 minutes) of the counter.
+    Default time resolution (30 minutes) of the counters. Can be set per counter at construction.
     """
 
-    def __init__(self, records: list[Record]):
+    def __init__(self, records: Iterable[Record] = (), time_resolution: datetime.timedelta = None):
         """
         Build a CarCounter with a list of records.
         :param records: a list of record for the car counter.
-               The object will store a copy of this list, sorting it by increasing record's timestamp.
+               The object will store the records as columns, sorted by increasing record's timestamp.
+        :param time_resolution: the time resolution of the counter, if not the default one
+        """
+        if time_resolution is not None and time_resolution != type(self).time_resolution:
+            self.time_resolution = time_resolution
+        timestamps = array("q")
+        counts = array("q")
+        for rec in records:
+            timestamps.append(rec.seconds)
+            counts.append(rec.car_count)
+        if len(timestamps) > 1:
+            timestamps, counts = self._sort_columns(timestamps, counts)
+        self._set_columns(timestamps, counts)
+
+    @classmethod
+    def from_columns(cls, timestamps: Iterable[int], counts: Iterable[int], time_resolution: datetime.timedelta = None):
+        """
+        Build a CarCounter directly from its columns, without creating any Record.
+
+        :param timestamps: timestamps in seconds since the epoch.
+               The columns are sorted (stable) by timestamp, unless they already are.
+        :param counts: car counts, aligned with the timestamps
+        :param time_resolution: the time resolution of the counter, if not the default one
+        :return: a CarCounter object
         """
-        self.records = sorted(records, key=lambda rec: rec.timestamp)
+        timestamps = array("q", timestamps)
+        counts = array("q", counts)
+        if len(timestamps) != len(counts):
+            raise ValueError(f"Column length mismatch: {len(timestamps)} timestamps for {len(counts)} counts")
+        return cls.from_sorted_columns(*cls._sort_columns(timestamps, counts), time_resolution)
+
+    @staticmethod
+    @profiled("sort")
+    def _sort_columns(timestamps: array, counts: array) -> tuple[array, array]:
+        """ Sort (stable) the columns by timestamp, unless they already are """
+        if all(map(le, timestamps, islice(timestamps, 1, None))):
+            return timestamps, counts
+        order = sorted(range(len(timestamps)), key=timestamps.__getitem__)
+        return array("q", map(timestamps.__getitem__, order)), array("q", map(counts.__getitem__, order))
+
+    @classmethod
+    def from_sorted_columns(cls, timestamps, counts, time_resolution: datetime.timedelta = None):
+        """
+        Build a CarCounter over existing columns, without copying nor checking them.
+
+        :param timestamps: timestamps in seconds since the epoch, sorted: an array or a memoryview of 64 bits integers
+        :param counts: car counts, aligned with the timestamps (same type)
+        :param time_resolution: the time resolution of the counter, if not the default one
+        :return: a CarCounter object, using the given columns
+        """
+        counter = cls(time_resolution=time_resolution)
+        counter._set_columns(timestamps, counts)
+        return counter
+
+    @classmethod
+    @profiled("merge", records=lambda args, counter: len(counter))
+    def from_runs(cls, runs: Iterable[tuple[Sequence[int], Sequence[int]]], time_resolution: datetime.timedelta = None):
+        """
+        Build a CarCounter from sorted runs of records, e.g. the columns of several files, without sorting them again.
+        Runs that do not overlap in time are concatenated, otherwise they are merged with a k-way merge.
+        Records with the same timestamp keep the order of their runs, as a stable sort of all the records would.
+
+        :param runs: tuples of columns (timestamps, counts), each one sorted by timestamp
+        :param time_resolution: the time resolution of the counter, if not the default one
+        :return: a CarCounter object
+        """
+        runs = [(timestamps, counts) for timestamps, counts in runs if len(timestamps)]
+        for timestamps, counts in runs:
+            if len(timestamps) != len(counts):
+                raise ValueError(f"Column length mismatch: {len(timestamps)} timestamps for {len(counts)} counts")
+        # Order of the runs by first timestamp: it is enough when each run ends before the next one starts
+        order = sorted(range(len(runs)), key=lambda i: (runs[i][0][0], i))
+        timestamps = array("q")
+        counts = array("q")
+        if all(runs[a][0][-1] < runs[b][0][0] or (runs[a][0][-1] == runs[b][0][0] and a < b)
+               for a, b in zip(order, islice(order, 1, None))):
+            for i in order:
+                timestamps.extend(runs[i][0])
+                counts.extend(runs[i][1])
+        else:
+            merged = merge(*(zip(run_timestamps, run_counts) for run_timestamps, run_counts in runs), key=itemgetter(0))
+            for timestamp, count in merged:
+                timestamps.append(timestamp)
+                counts.append(count)
+        return cls.from_sorted_columns(timestamps, counts, time_resolution)
+
+    @classmethod
+    def from_file(cls, path, time_resolution: datetime.timedelta = None):
+        """
+        Build a CarCounter from a file, with one record 'YYYY-MM-DDThh:mm:ss n' per line.
+        The file is read by large chunks and parsed straight into columns (see ColumnParser).
+        Compressed files are decompressed while being read (see open_input).
+
+        :param path: path to the file
+        :param time_resolution: the time resolution of the counter, if not the default one
+        :return: a CarCounter object
+        """
+        with open_input(path) as file:
+            return cls.from_columns(*ColumnParser.parse_chunks(read_chunks(file)), time_resolution)
+
+    @classmethod
+    def from_cached_file(cls, path, cache_path=None, time_resolution: datetime.timedelta = None):
+        """
+        Build a CarCounter from a text file (see from_file), going through a binary cache file (see save).
+        The cache is used if it was built from the text file with its current size and modification time
+        (and has the same time resolution), and (re)built otherwise: a text file replaced by an older one
+        (e.g. copied with its times) is not mistaken for the source of the cache. Failing to write the cache is not an error.
+
+        :param path: path to the text file
+        :param cache_path: path to the cache file. Default to the path of the text file followed by '.cache'
+        :param time_resolution: the time resolution of the counter, if not the default one
+        :return: a CarCounter object
+        """
+        cache_path = str(path) + ".cache" if cache_path is None else cache_path
+        time_resolution = cls.time_resolution if time_resolution is None else time_resolution
+        # Taken before reading the text file: a change while it is read makes the cache out of date
+        status = os.stat(path)
+        source = (status.st_size, status.st_mtime_ns)
+        try:
+            counter = cls.open(cache_path, source)
+            if counter.time_resolution == time_resolution:
+                return counter
+        except (OSError, ValueError):
+            pass
+        counter = cls.from_file(path, time_resolution)
+        try:
+            counter.save(cache_path, source)
+        except OSError:
+            pass
+        return counter
+
+    @profiled("save")
+    def save(self, path, source: tuple[int, int] = None):
+        """
+        Save the counter in a binary file, which can be opened with CarCounter.open without parsing nor copying.
+
+        The file is made of a header (magic bytes, format version, time resolution in seconds, number of records,
+        number of days, size and modification time of the source), followed by the timestamps and counts columns,
+        and by the per-day index:
+        the days (since the epoch) and the index of their first record. All numbers are little endian,
+        and the columns are 64 bits integers.
+        The file is written aside and then renamed, so a reader never sees a partial file.
+
+        :param path: path to the file
+        :param source: the size and modification time (in nanoseconds) of the text file the counter was read from,
+               if any (see from_cached_file)
+        """
+        source_size, source_time = (-1, -1) if source is None else source
+        days = array("q")
+        offsets = array("q")
+        for day, start, _ in self.date_ranges():
+            days.append(day)
+            offsets.append(start)
+        columns = [array("q", self.timestamps), array("q", self.counts), days, offsets]
+        if sys.byteorder != "little":
+            for column in columns:
+                column.byteswap()
+
+        resolution = self.time_resolution // _ONE_SECOND
+        temporary = f"{path}.{os.getpid()}.tmp"
+        with open(temporary, "wb") as file:
+            file.write(_CACHE_HEADER.pack(CACHE_MAGIC, CACHE_VERSION, 0, resolution, len(self), len(days),
+                                           source_size, source_time))
+            for column in columns:
+                column.tofile(file)
+        os.replace(temporary, path)
+
+    @classmethod
+    @profiled("open", records=lambda args, counter: len(counter))
+    def open(cls, path, source: tuple[int, int] = None):
+        """
+        Open a binary file written by save. The file is memory-mapped, and the columns are views over it:
+        nothing is parsed nor copied (except on big endian machines).
+
+        :param path: path to the file
+        :param source: if given, the size and modification time (in nanoseconds) of the text file
+               the counter must have been saved from (see save)
+        :return: a CarCounter object
+        """
+        with open(path, "rb") as file:
+            mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(mapped) < _CACHE_HEADER.size:
+            raise ValueError(f"{path} is not a car counter cache file")
+        magic, version, _, resolution, size, day_count, *saved_source = _CACHE_HEADER.unpack_from(mapped)
+        if magic != CACHE_MAGIC or version != CACHE_VERSION:
+            raise ValueError(f"{path} is not a car counter cache file (version {CACHE_VERSION})")
+        if source is not None and tuple(saved_source) != tuple(source):
+            raise ValueError(f"{path} was not saved from this source")
+        if len(mapped) != _CACHE_HEADER.size + 8 * (2 * size + 2 * day_count):
+            raise ValueError(f"{path} is truncated")
+
+        view = memoryview(mapped)[_CACHE_HEADER.size:].cast("q")
+        columns = [view[0:size], view[size:2 * size],
+                   view[2 * size:2 * size + day_count], view[2 * size + day_count:]]
+        if sys.byteorder != "little":
+            columns = [array("q", column) for column in columns]
+            for column in columns:
+                column.byteswap()
+
+        counter = cls.from_sorted_columns(columns[0], columns[1], datetime.timedelta(seconds=resolution))
+        counter._day_index = (columns[2], columns[3])
+        counter._mapped = mapped  # Keep the mapping alive as long as the counter
+        return counter
+
+    def _set_columns(self, timestamps, counts):
+        if len(timestamps) != len(counts):
+            raise ValueError(f"Column length mismatch: {len(timestamps)} timestamps for {len(counts)} counts")
+        self.timestamps = timestamps
+        """ Sorted timestamps, in seconds since the epoch (an array, or a memoryview of 64 bits integers) """
+        self.counts = counts
+        """ Car counts, aligned with the timestamps """
+        self._day_index = None  # Optional (days, index of their first record), as loaded from a cache file
+        self._prefix = None  # Prefix sums of the counts, built on demand (see prefix_sums)
+        # Aggregates computed on demand, and then maintained by add_records
+        self._total = None  # Total number of cars
+        self._days = None  # Day since the epoch -> number of cars that day
+        self._run_starts = None  # Index of the first record of each contiguous block
+        self._rollups: dict[str, tuple[array, array]] = {}  # Level -> (bucket starts, bucket counts), see rollup
+        self._clear_queries()
+
+    def _clear_queries(self):
+        """ Drop the memoized answers """
+        self._queries = OrderedDict()  # (query, n) -> answer as record indexes, least recently used first
+
+    def _memoized(self, query: str, n, compute):
+        """
+        The memoized answer of a query, computed if needed
+
+        :param query: the name of the query
+        :param n: the parameter of the query
+        :param compute: function computing the answer
+        :return: the answer, as given by compute
+        """
+        key = (query, n)
+        queries = self._queries
+        if key in queries:
+            queries.move_to_end(key)
+            return queries[key]
+        answer = queries[key] = compute()
+        if len(queries) > QUERY_CACHE_SIZE:
+            queries.popitem(last=False)
+        return answer
+
+    def add_records(self, records: Iterable[Record], duplicates: str = "keep"):
+        """
+        Add records to the counter. Only the new records are sorted, and then merged with the existing ones:
+        when they all come after the existing ones, they are simply appended.
+        The aggregates already computed (total, count per day, contiguous blocks and prefix sums) are updated
+        with the new records instead of being recomputed (blocks and prefix sums are recomputed on demand
+        when records are inserted before existing ones).
+
+        :param records: the records to add, in any order
+        :param duplicates: what to do with records sharing a timestamp, see DUPLICATE_POLICIES
+        """
+        pairs = [(rec.seconds, rec.car_count) for rec in records]
+        self.add_columns(map(itemgetter(0), pairs), map(itemgetter(1), pairs), duplicates)
+
+    def add_columns(self, timestamps: Iterable[int], counts: Iterable[int], duplicates: str = "keep"):
+        """
+        Add records given as columns, see add_records.
+
+        :param timestamps: timestamps in seconds since the epoch, in any order
+        :param counts: car counts, aligned with the timestamps
+        :param duplicates: what to do with records sharing a timestamp, see DUPLICATE_POLICIES
+        """
+        if duplicates not in DUPLICATE_POLICIES:
+            raise ValueError(f"Unknown duplicate policy {duplicates!r}, expected one of {DUPLICATE_POLICIES}")
+        batch = sorted(zip(timestamps, counts), key=itemgetter(0))
+
+        # Duplicates within the batch
+        if duplicates != "keep":
+            unique: list[tuple[int, int]] = []
+            for timestamp, count in batch:
+                if not unique or unique[-1][0] != timestamp:
+                    unique.append((timestamp, count))
+                elif duplicates == "error":
+                    raise ValueError(f"Duplicate timestamp {from_seconds(timestamp)}")
+                elif duplicates == "replace":
+                    unique[-1] = (timestamp, count)
+                elif duplicates == "sum":
+                    unique[-1] = (timestamp, unique[-1][1] + count)
+            batch = unique
+        if len(batch) == 0:
+            return
+
+        last = self.timestamps[-1] if len(self) else None
+        if last is None or batch[0][0] > last or (duplicates == "keep" and batch[0][0] == last):
+            self._append(batch)
+        else:
+            self._merge(batch, duplicates)
+
+    def _append(self, batch: list[tuple[int, int]]):
+        """ Add sorted records coming after the existing ones """
+        size = len(self)
+        timestamps = array("q", map(itemgetter(0), batch))
+        counts = array("q", map(itemgetter(1), batch))
+
+        if self._total is not None:
+            self._total += sum(counts)
+        if self._days is not None:
+            for timestamp, count in batch:
+                day = timestamp // SECONDS_PER_DAY
+                self._days[day] = self._days.get(day, 0) + count
+        if self._run_starts is not None:
+            step = self.time_resolution // _ONE_SECOND
+            previous = self.timestamps[-1] if size else None
+            for i, timestamp in enumerate(timestamps):
+                if previous is None or timestamp - previous > step:
+                    self._run_starts.append(size + i)
+                previous = timestamp
+        if self._prefix is not None:
+            self._prefix.extend(islice(accumulate(counts, initial=self._prefix[-1]), 1, None))
+        self._day_index = None
+        self._rollups = {}
+        self._clear_queries()
+
+        # Extend the columns in place, unless they are shared with views (or memory-mapped): copy them then
+        try:
+            if not isinstance(self.timestamps, array) or not isinstance(self.counts, array):
+                raise BufferError
+            self.timestamps.extend(timestamps)
+            try:
+                self.counts.extend(counts)
+            except BufferError:
+                del self.timestamps[size:]
+                raise
+        except BufferError:
+            self.timestamps = array("q", self.timestamps) + timestamps
+            self.counts = array("q", self.counts) + counts
+
+    def _merge(self, batch: list[tuple[int, int]], duplicates: str):
+        """ Merge sorted records with the existing ones, in new columns """
+        old_timestamps = self.timestamps
+        old_counts = self.counts
+        timestamps = array("q")
+        counts = array("q")
+        changes: list[tuple[int, int]] = []  # (timestamp, count) to add to the aggregates (negative when removed)
+
+        position = 0  # Index of the first existing record not copied yet
+        for timestamp, count in batch:
+            left = bisect_left(old_timestamps, timestamp, position)
+            right = bisect_right(old_timestamps, timestamp, left)
+            if left == right or duplicates == "keep":
+                timestamps.extend(old_timestamps[position:right])
+                counts.extend(old_counts[position:right])
+                position = right
+            elif duplicates == "error":
+                raise ValueError(f"Duplicate timestamp {from_seconds(timestamp)}")
+            elif duplicates == "ignore":
+                continue
+            elif duplicates == "replace":
+                timestamps.extend(old_timestamps[position:left])
+                counts.extend(old_counts[position:left])
+                changes += ((old_timestamps[i], -old_counts[i]) for i in range(left, right))
+                position = right
+            elif duplicates == "sum":
+                timestamps.extend(old_timestamps[position:left])
+                counts.extend(old_counts[position:left])
+                changes.append((timestamp, -old_counts[left]))
+                count += old_counts[left]
+                position = left + 1
+            timestamps.append(timestamp)
+            counts.append(count)
+            changes.append((timestamp, count))
+        timestamps.extend(old_timestamps[position:])
+        counts.extend(old_counts[position:])
+
+        total = self._total
+        days = self._days
+        self._set_columns(timestamps, counts)
+        if total is not None:
+            self._total = total + sum(map(itemgetter(1), changes))
+        if days is not None:
+            for timestamp, count in changes:
+                day = timestamp // SECONDS_PER_DAY
+                days[day] = days.get(day, 0) + count
+            self._days = days
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def _record(self, index: int) -> Record:
+        return Record.from_seconds(self.timestamps[index], self.counts[index])
+
+    @property
+    def records(self) -> list[Record]:
+        """
+        The records of the counter, sorted by timestamp.
+        The records are created on demand: prefer the query methods, which work on the columns.
+        """
+        return [self._record(i) for i in range(len(self))]
 
     @staticmethod
     def total_count(records: list[Record]) -> int:
@@ -82,171 +931,422 @@ class CarCounter:
         return reduce(lambda acc, ts: acc + ts.car_count, records, 0)
 
     @staticmethod
-    def group_by_date(records: list[Record]) -> list[list[Record]]:
+    @profiled("group_by_date")
+    def group_by_date(records: Sequence[Record]) -> list[Sequence[Record]]:
         """
         Group the record by date.
 
         :param records: a list of record. It is assumed that the list is sorted by record's timestamp.
-        :return: A list where each item is itself a list of records from the same date.
+        :return: A list where each item is itself a list of records from the same date
+            (a view if the records are a RecordsView).
         """
-        if len(records) == 0:
-            return []
-        else:
-            # Main result list: each item is a list of records
-            date_list: list[list[Record]] = []
-
-            # Pre-loop
-            # Init of the variables using the first record (list is non-empty per above condition)
-            same_date_list = [records[0]]  # Sub list of records sharing the same day
-            current_date = same_date_list[0].timestamp.date()  # Current date of same_date_list
-
-            # Loop: check if a record 'rec' is from the 'current_date'
-            # If so, add it in the same_date_list, else save same_date_list in date_list and create a new list for rec,
-            # changing the current_date to its date
-            for rec in records[1:]:
-                if rec.timestamp.date() == current_date:
-                    same_date_list.append(rec)
-                else:
-                    date_list.append(same_date_list)
-                    same_date_list = [rec]
-                    current_date = rec.timestamp.date()
-
-            # Post-loop
-            # Complete date_list with the last same_date_list
-            date_list.append(same_date_list)
-
-        return date_list
+        return [records[start:stop] for start, stop in CarCounter.date_group_ranges(records)]
+
+    @staticmethod
+    def date_group_ranges(records: Sequence[Record]) -> Iterator[tuple[int, int]]:
+        """
+        Group the records by date, lazily: the groups are given as index ranges, without copying any record.
+
+        :param records: a sequence of records, sorted by timestamp
+        :return: an iterator of tuples (start index, stop index), one per date
+        """
+        days = map(floordiv, map(_SECONDS, records), repeat(SECONDS_PER_DAY))
+        next_days = map(floordiv, map(_SECONDS, islice(records, 1, None)), repeat(SECONDS_PER_DAY))
+        # Indexes i such that the record i is not on the same date as the record i-1
+        return _ranges(compress(range(1, len(records)), map(ne, days, next_days)), len(records))
 
     @staticmethod
-    def group_by_contiguity(records: list[Record]) -> list[list[Record]]:
+    @profiled("group_by_contiguity")
+    def group_by_contiguity(records: Sequence[Record],
+                            time_resolution: datetime.timedelta = None) -> list[Sequence[Record]]:
         """
         Group contiguous records together.
         Two contiguous records are grouped if they are withing the time resolution of the counter.
         I.E. 2 contiguous timestamps T1 and T2 are grouped if T1 < T2 AND T2 - T1 <= time_resolution
 
         :param records: a list of record. It is assumed that the list is sorted by record's timestamp.
-        :return: A list where each item is itself a list of contiguous records within the time resolution of the counter.
+        :param time_resolution: the time resolution. Default to the default time resolution of the counters.
+        :return: A list where each item is itself a list of contiguous records within the time resolution of the counter
+            (a view if the records are a RecordsView).
         """
-        if len(records) == 0:
-            return []
-        else:
-            # Main result list: each item is a list of records
-            result_list: list[list[Record]] = []
-
-            # Pre-loop
-            # Init of the variables using the first record (list is non-empty per above condition)
-            contiguous_list: list[Record] = [records[0]]  # Current list of contiguous records
-            previous = contiguous_list[0].timestamp  # Timestamp of the last record in contiguous_list
-
-            # Loop
-            # Extend contiguous_list while the record's timestamp are previous+time_resolution.
-            # Save the list and start a new one when a record can't extend it.
-            # Always update 'previous' as we progress through the list
-            for ts in records[1:]:
-                if ts.timestamp - previous <= CarCounter.time_resolution:
-                    contiguous_list.append(ts)
-                else:
-                    result_list.append(contiguous_list)
-                    contiguous_list = [ts]
-                previous = ts.timestamp
-
-            # Post loop
-            # Complete result_list with the last contiguous_list
-            result_list.append(contiguous_list)
-
-        return result_list
+        return [records[start:stop] for start, stop in CarCounter.contiguity_group_ranges(records, time_resolution)]
+
+    @staticmethod
+    def contiguity_group_ranges(records: Sequence[Record],
+                                time_resolution: datetime.timedelta = None) -> Iterator[tuple[int, int]]:
+        """
+        Group contiguous records together (see group_by_contiguity), lazily:
+        the groups are given as index ranges, without copying any record.
+
+        :param records: a sequence of records, sorted by timestamp
+        :param time_resolution: the time resolution. Default to the default time resolution of the counters.
+        :return: an iterator of tuples (start index, stop index), one per contiguous block
+        """
+        time_resolution = CarCounter.time_resolution if time_resolution is None else time_resolution
+        step = time_resolution / _ONE_SECOND  # In seconds, as the timestamps of the records
+        gaps = map(sub, map(_SECONDS, islice(records, 1, None)), map(_SECONDS, records))
+        # Indexes i such that the record i is not within the time resolution of the record i-1
+        return _ranges(compress(range(1, len(records)), map(gt, gaps, repeat(step))), len(records))
+
+    def range_count(self, start: int, stop: int) -> int:
+        """ Sum of the car counts over the index range [start, stop[ """
+        if self._prefix is not None:
+            return self._prefix[stop] - self._prefix[start]
+        return sum(memoryview(self.counts)[start:stop])
+
+    def prefix_sums(self) -> array:
+        """
+        Prefix sums of the counts, built on the first call: the item i is the sum of the i first counts.
+        :return: an array of len(self) + 1 items
+        """
+        if self._prefix is None:
+            self._prefix = array("q", accumulate(self.counts, initial=0))
+        return self._prefix
+
+    def index_range(self, start: datetime.datetime = None, end: datetime.datetime = None) -> tuple[int, int]:
+        """
+        Find the records within a time range, by binary search over the timestamps
+
+        :param start: beginning of the range (included). None for no lower bound.
+        :param end: end of the range (excluded). None for no upper bound.
+        :return: the index range [first, stop[ of the records within the time range
+        """
+        first = 0 if start is None else bisect_left(self.timestamps, to_seconds(start))
+        stop = len(self) if end is None else bisect_left(self.timestamps, to_seconds(end), first)
+        return first, max(first, stop)
 
+    def count_between(self, start: datetime.datetime = None, end: datetime.datetime = None) -> int:
+        """
+        Count the cars in the records within a time range, in O(log N) (once the prefix sums are built)
+
+        :param start: beginning of the range (included). None for no lower bound.
+        :param end: end of the range (excluded). None for no upper bound.
+        :return: Number of cars
+        """
+        first, stop = self.index_range(start, end)
+        prefix = self.prefix_sums()
+        return prefix[stop] - prefix[first]
+
+    def records_between(self, start: datetime.datetime = None, end: datetime.datetime = None) -> RecordsView:
+        """
+        The records within a time range, as a view (the records are created on access)
+
+        :param start: beginning of the range (included). None for no lower bound.
+        :param end: end of the range (excluded). None for no upper bound.
+        :return: a RecordsView
+        """
+        return RecordsView(self.timestamps, self.counts, *self.index_range(start, end))
+
+    def between(self, start: datetime.datetime = None, end: datetime.datetime = None) -> "CarCounter":
+        """
+        A counter restricted to a time range. Its columns are views over the columns of this counter.
+
+        :param start: beginning of the range (included). None for no lower bound.
+        :param end: end of the range (excluded). None for no upper bound.
+        :return: a CarCounter
+        """
+        first, stop = self.index_range(start, end)
+        return type(self).from_sorted_columns(memoryview(self.timestamps)[first:stop],
+                                              memoryview(self.counts)[first:stop], self.time_resolution)
+
+    def date_ranges(self) -> Iterator[tuple[int, int, int]]:
+        """
+        Split the columns by date.
+        :return: an iterator of tuples (day since the epoch, start index, stop index)
+        """
+        if self._day_index is not None:
+            days, starts = self._day_index
+            yield from zip(days, starts, islice(starts, 1, None))
+            if len(days):
+                yield days[-1], starts[-1], len(self)
+            return
+        timestamps = self.timestamps
+        start = 0
+        while start < len(timestamps):
+            day = timestamps[start] // SECONDS_PER_DAY
+            stop = bisect_left(timestamps, (day + 1) * SECONDS_PER_DAY, start)
+            yield day, start, stop
+            start = stop
+
+    def contiguity_ranges(self) -> Iterator[tuple[int, int]]:
+        """
+        Split the columns in contiguous blocks, following the same rule as group_by_contiguity.
+        :return: an iterator of tuples (start index, stop index)
+        """
+        if self._run_starts is None:
+            self._run_starts = self._group_by_contiguity()
+        yield from _ranges(islice(self._run_starts, 1, None), len(self))
+
+    @profiled("group_by_contiguity")
+    def _group_by_contiguity(self) -> array:
+        """ Start indexes of the contiguous blocks """
+        timestamps = self.timestamps
+        step = self.time_resolution // _ONE_SECOND
+        # Indexes i such that timestamps[i] - timestamps[i-1] > step, i.e. the start of a new block
+        gaps = map(gt, map(sub, islice(timestamps, 1, None), timestamps), repeat(step))
+        starts = array("q", [0] if len(timestamps) else [])
+        starts.extend(compress(range(1, len(timestamps)), gaps))
+        return starts
+
+    @profiled("total_count")
     def get_total_count(self) -> int:
         """
         Return how many cars have been counted by this counter in total
         :return: Total number of cars
         """
-        return CarCounter.total_count(self.records)
+        if self._total is None:
+            if self._rollups:
+                # Read the smallest rollup built so far rather than the records
+                self._total = sum(min(self._rollups.values(), key=lambda rollup: len(rollup[0]))[1])
+            else:
+                self._total = sum(self.counts)
+        return self._total
 
     def get_count_by_date(self) -> list[tuple[str, int]]:
         """
         Count the number of car per day (represented as a string yyyy-mm-dd)
         :return: a list of tuples (date as a string, count)
         """
-        return list(map(
-            lambda l: (str(l[0].timestamp.date()), CarCounter.total_count(l)),
-            CarCounter.group_by_date(self.records)
-        ))
+        def compute():
+            if self._days is None:
+                self._days = self._group_by_date()
+            return [(day_to_string(day), count) for day, count in sorted(self._days.items())]
+
+        return list(self._memoized("count_by_date", None, compute))
+
+    @profiled("group_by_date")
+    def _group_by_date(self) -> dict[int, int]:
+        """ Number of cars per day since the epoch """
+        return {day: self.range_count(start, stop) for day, start, stop in self.date_ranges()}
+
+    def rollup(self, level: str) -> tuple[array, array]:
+        """
+        Pre-aggregated counts at a coarser level than the records, built on the first call.
+        The hourly rollup is built from the records, the daily one from the count per day,
+        and the weekly and monthly ones from the daily one.
+
+        :param level: one of ROLLUP_LEVELS
+        :return: the columns (start of the periods in seconds since the epoch, number of cars) of the non-empty periods
+        """
+        if level not in ROLLUP_LEVELS:
+            raise ValueError(f"Unknown rollup level {level!r}, expected one of {ROLLUP_LEVELS}")
+        if level not in self._rollups:
+            if level == "day":
+                self.get_count_by_date()
+                days = sorted(self._days)
+                rollup = (array("q", (day * SECONDS_PER_DAY for day in days)), array("q", map(self._days.get, days)))
+            elif level in _ROLLUP_SOURCES:
+                rollup = _aggregate(*self.rollup(_ROLLUP_SOURCES[level]), _ROLLUP_BOUNDS[level])
+            else:
+                rollup = _aggregate(self.timestamps, self.counts, _ROLLUP_BOUNDS[level])
+            self._rollups[level] = rollup
+        return self._rollups[level]
+
+    def get_count_by_period(self, level: str) -> list[tuple[str, int]]:
+        """
+        Count the number of cars per period (see rollup). The periods are represented by their start:
+        'yyyy-mm-ddThh:00:00' for hours, 'yyyy-mm-dd' for days and weeks (their Monday), 'yyyy-mm' for months.
+
+        :param level: one of ROLLUP_LEVELS
+        :return: a list of tuples (period as a string, count) for the periods with records
+        """
+        starts, counts = self.rollup(level)
+        return [(_ROLLUP_LABELS[level](start), count) for start, count in zip(starts, counts)]
+
+    def get_top_periods(self, n: int, level: str) -> list[tuple[str, int]]:
+        """
+        Get the n periods (see get_count_by_period) with the most cars, including ties as get_top_n does.
+
+        :param n: number of periods
+        :param level: one of ROLLUP_LEVELS
+        :return: a list of tuples (period as a string, count), in time order
+        """
+        starts, counts = self.rollup(level)
+        top = CarCounter.from_sorted_columns(starts, counts).get_top_n(n)
+        return [(_ROLLUP_LABELS[level](rec.seconds), rec.car_count) for rec in top]
 
-    def get_top_n(self, n: int) -> list[Record]:
+    @profiled("top_n")
+    def get_top_n(self, n: int, start: datetime.datetime = None, end: datetime.datetime = None) -> list[Record]:
         """
         Get the top n half hours records with the top number of cars.
         Include ties, which may lead to more than n elements.
+        :param start: only consider the records from this time (included). None for no lower bound.
+        :param end: only consider the records until this time (excluded). None for no upper bound.
         :return: a list of records, ordered by record's timestamp, representing the top items
             The list may have less than n elements if n is larger than the number of records
             The list may have more than n elements if ties (records with the same count) exists
         """
-        if len(self.records) == 0:
-            return []
-        elif len(self.records) <= n:
-            return self.records.copy()
-        else:
-            # Create a mapping (car counts->list of records).
-            candidates: dict[int, list[Record]] = {}
-            for ts in self.records:
-                candidates.setdefault(ts.car_count, []).append(ts)
+        if start is not None or end is not None:
+            return self.between(start, end).get_top_n(n)
+        return list(map(self._record, self._memoized("top_n", n, lambda: self._select_n(n, largest=True))))
 
-            # Create a new sorted dictionary; sort key (car counts) in decreasing order
-            candidates = dict(sorted(candidates.items(), reverse=True))
+    def get_top_ns(self, ns: Iterable[int]) -> dict[int, list[Record]]:
+        """
+        Get the top n records for several n at once (see get_top_n), from one selection for the largest n:
+        a heap of its n largest counts gives the threshold of every n, and the records reaching the lowest threshold
+        are the candidates, within which each n is then selected.
 
-            # Build the result_list list base on the now sorted candidates
-            result_list: list[Record] = []
-            for count, timestamps in candidates.items():
-                if len(result_list) >= n:
-                    break
-                else:
-                    result_list += timestamps
+        :param ns: the numbers of records
+        :return: mapping n -> list of records, ordered by record's timestamp
+        """
+        ns = list(ns)
+        missing = sorted({n for n in ns if 0 < n < len(self) and ("top_n", n) not in self._queries})
+        if len(missing) > 1:
+            counts = self.counts
+            timestamps = self.timestamps
+            largest = nlargest(missing[-1], counts)
+            candidates = list(compress(range(len(self)), map(ge, counts, repeat(largest[-1]))))
+            candidate_counts = list(map(counts.__getitem__, candidates))
+            key = lambda i: (timestamps[i], -counts[i])
+            for n in missing:
+                selected = compress(candidates, map(ge, candidate_counts, repeat(largest[n - 1])))
+                self._memoized("top_n", n, lambda: sorted(selected, key=key))
+        return {n: self.get_top_n(n) for n in ns}
 
-            # Sort the result_list by timestamp to maintain the format
-            return sorted(result_list, key=lambda x: x.timestamp)
+    @profiled("bottom_n")
+    def get_bottom_n(self, n: int, start: datetime.datetime = None, end: datetime.datetime = None) -> list[Record]:
+        """
+        Get the n half hours records with the least number of cars.
+        Include ties, which may lead to more than n elements (same rules as get_top_n).
+        :param start: only consider the records from this time (included). None for no lower bound.
+        :param end: only consider the records until this time (excluded). None for no upper bound.
+        :return: a list of records, ordered by record's timestamp, representing the bottom items
+        """
+        if start is not None or end is not None:
+            return self.between(start, end).get_bottom_n(n)
+        return list(map(self._record, self._memoized("bottom_n", n, lambda: self._select_n(n, largest=False))))
 
-    def get_least_period(self, n: int) -> list[list[Record]]:
+    def _select_n(self, n: int, largest: bool) -> list[int]:
+        """
+        Select the records with the n largest (or smallest) counts, including ties.
+        :return: the indexes of the records, in timestamp order
+        """
+        if len(self) == 0 or n <= 0:
+            return []
+        elif len(self) <= n:
+            return list(range(len(self)))
+        else:
+            # Taking the records count by count until we have n of them stops at the n-th largest count:
+            # it is the threshold, found with a heap of n counts, and all the records reaching it are selected.
+            timestamps = self.timestamps
+            counts = self.counts
+            if largest:
+                threshold = nlargest(n, counts)[-1]
+                selected = compress(range(len(self)), map(ge, counts, repeat(threshold)))
+                key = lambda i: (timestamps[i], -counts[i])
+            else:
+                threshold = nsmallest(n, counts)[-1]
+                selected = compress(range(len(self)), map(le, counts, repeat(threshold)))
+                key = lambda i: (timestamps[i], counts[i])
+            # Timestamp order. Records sharing a timestamp are ordered by count, as they were taken.
+            return sorted(selected, key=key)
+
+    @profiled("least_period")
+    def get_least_period(self, n: int, start: datetime.datetime = None,
+                         end: datetime.datetime = None) -> list[list[Record]]:
         """
         Check contiguous periods of n half hours. Return the ones with the least amount of cars.
         Include ties, which may lead to more than one period.
         Shorter periods than 'n' half hours are not counted.
+        :param start: only consider the records from this time (included). None for no lower bound.
+        :param end: only consider the records until this time (excluded). None for no upper bound.
         :return: a list of list, where each inner list represent a period
         """
-        if n <= 0 or len(self.records) == 0:
+        if start is not None or end is not None:
+            return self.between(start, end).get_least_period(n)
+        if n <= 0:
             return []
-        else:
-            # Only keep contiguous block with enough record
-            contiguous = list(filter(lambda l: len(l) >= n, self.group_by_contiguity(self.records)))
 
-            if len(contiguous) == 0:
-                return []
+        def compute():
+            return CarCounter.least_window_starts(self.counts, self.contiguity_ranges(), n, self._prefix)[1]
+
+        return [list(map(self._record, range(s, s + n))) for s in self._memoized("least_period", n, compute)]
+
+    def get_least_periods(self, ns: Iterable[int]) -> dict[int, list[list[Record]]]:
+        """
+        Get the least periods for several n at once (see get_least_period):
+        the contiguous blocks and the prefix sums of the counts are computed once,
+        and the sum of any window is then a difference of two prefix sums (see prefix_window_sums).
+
+        :param ns: the numbers of records of the periods
+        :return: mapping n -> list of periods
+        """
+        ns = list(ns)
+        if sum(n > 0 and ("least_period", n) not in self._queries for n in set(ns)) > 1:
+            self.prefix_sums()
+        return {n: self.get_least_period(n) for n in ns}
+
+    @staticmethod
+    def window_sums(counts, start: int, stop: int, n: int) -> Iterator[int]:
+        """
+        Sums of the windows of n consecutive counts within the index range [start, stop[, computed as a running sum:
+        each window is obtained from the previous one by adding the entering count and removing the leaving one.
+
+        :param counts: a sequence of car counts
+        :param start: index of the first count of the range
+        :param stop: index after the last count of the range
+        :param n: size of the windows
+        :return: an iterator over the sums of the windows starting at start, start+1, ..., stop-n
+        """
+        if n <= 0 or stop - start < n:
+            return iter(())
+        if isinstance(counts, array):
+            counts = memoryview(counts)  # Slices without copy
+        first = sum(counts[start:start + n])
+        deltas = map(sub, counts[start + n:stop], counts[start:stop - n])
+        return accumulate(deltas, initial=first)
+
+    @staticmethod
+    def prefix_window_sums(prefix, start: int, stop: int, n: int) -> Iterator[int]:
+        """
+        Sums of the windows of n consecutive counts within the index range [start, stop[,
+        computed as differences of prefix sums.
+
+        :param prefix: the prefix sums of the counts (see prefix_sums)
+        :param start: index of the first count of the range
+        :param stop: index after the last count of the range
+        :param n: size of the windows
+        :return: an iterator over the sums of the windows starting at start, start+1, ..., stop-n
+        """
+        if n <= 0 or stop - start < n:
+            return iter(())
+        if isinstance(prefix, array):
+            prefix = memoryview(prefix)
+        return map(sub, prefix[start + n:stop + 1], prefix[start:stop - n + 1])
+
+    @staticmethod
+    def least_window_starts(counts, blocks: Iterable[tuple[int, int]], n: int,
+                            prefix=None) -> tuple[int, list[int]]:
+        """
+        Find the windows of n consecutive counts with the smallest sum, keeping ties.
+        Windows do not cross the blocks boundaries, and blocks shorter than n are skipped.
+        Run in linear time in the number of counts, without recursion.
+
+        :param counts: a sequence of car counts
+        :param blocks: the (start, stop) index ranges of the blocks, in increasing order
+        :param n: size of the windows
+        :param prefix: the prefix sums of the counts, if available: the sums of the windows are then read from them
+        :return: a tuple (smallest sum, start indexes of the windows with that sum in increasing order).
+            The list of start indexes is empty (and the sum is 0) if there is no window.
+        """
+        best_count = 0
+        best_starts: list[int] = []
+        if prefix is None:
+            window_sums = partial(CarCounter.window_sums, counts)
+        else:
+            window_sums = partial(CarCounter.prefix_window_sums, prefix)
+        for start, stop in blocks:
+            if stop - start < n:
+                continue
+            # First pass: smallest window of the block. Second pass: where it occurs.
+            block_min = min(window_sums(start, stop, n))
+            if best_starts and block_min > best_count:
+                continue
+            starts = compress(range(start, stop - n + 1),
+                              map(eq, window_sums(start, stop, n), repeat(block_min)))
+            if not best_starts or block_min < best_count:
+                best_count = block_min
+                best_starts = list(starts)
             else:
-                # Helper function: check one contiguous block B
-                # Extract contiguous sub-blocks of length n within B and count the cars.
-                # The start of a sub-block is controlled by the "start" parameter
-                # Keep the ones (keep ties) with the smallest count in the accumulator "acc"
-                def check_block(block: list[Record], start: int, acc: list[tuple[list[Record], int]]):
-                    if start + n > len(block):
-                        return acc
-                    else:
-                        sub_block = block[start:start + n]
-                        sub_count = self.total_count(sub_block)
-                        if sub_count < acc[0][1]:
-                            acc = [(sub_block, sub_count)]
-                        elif sub_count == acc[0][1]:
-                            acc.append((sub_block, sub_count))
-                        return check_block(block, start + 1, acc)
-
-                # Init with the first period in the first contiguous block
-                init_list = list(contiguous[0][0:n])
-                init_count = self.total_count(init_list)
-
-                # Finish the first block, which is our Best So Far (bsf) block
-                bsf = check_block(contiguous[0], 1, [(init_list, init_count)])
-
-                # Do the other blocks
-                for b in contiguous[1:]:
-                    bsf = check_block(b, 0, bsf)
-
-                # Remove counts from the result
-                return list(map(lambda list_count: list_count[0], bsf))
+                best_starts.extend(starts)
+        return best_count, best_starts
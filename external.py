@@ -0,0 +1,142 @@
+import os
+import tempfile
+from array import array
+from heapq import merge
+from itertools import chain
+from operator import itemgetter
+from typing import Iterable, Iterator
+
+from car_counter import CarCounter, ColumnParser, open_input, read_chunks
+from profiling import profiled
+from streaming import StreamingCarCounter
+
+RUN_SIZE = 1 << 22
+"""
+Default number of records sorted in memory at once (64 MiB of columns).
+"""
+
+BLOCK_SIZE = 1 << 14
+"""
+Number of records read at once from each run while merging them.
+"""
+
+
+@profiled("spill", records=lambda args, _: len(args[1]))
+def write_run(path, timestamps: array, counts: array):
+    """
+    Write sorted columns as a run file: the (timestamp, count) pairs as 64 bits integers, in native byte order
+
+    :param path: path to the run file
+    :param timestamps: sorted timestamps
+    :param counts: counts aligned with the timestamps
+    """
+    pairs = array("q", bytes(16 * len(timestamps)))
+    pairs[0::2] = timestamps
+    pairs[1::2] = counts
+    with open(path, "wb") as file:
+        pairs.tofile(file)
+
+
+def read_run(path, block_size: int = BLOCK_SIZE) -> Iterator[tuple[int, int]]:
+    """
+    Read a run file written by write_run, one block at a time
+
+    :param path: path to the run file
+    :param block_size: number of records read at once
+    :return: an iterator of (timestamp, count)
+    """
+    with open(path, "rb") as file:
+        while block := file.read(16 * block_size):
+            pairs = array("q", block)
+            yield from zip(pairs[0::2], pairs[1::2])
+
+
+def parse_runs(chunks: Iterable[bytes], run_size: int) -> Iterator[tuple[array, array]]:
+    """
+    Parse text (one record 'YYYY-MM-DDThh:mm:ss n' per line) by runs of records
+
+    :param chunks: an iterable of chunks of bytes
+    :param run_size: the number of records of the runs. Runs end on a chunk, so they may be a bit larger,
+           and the last one may be smaller.
+    :return: an iterator of columns (timestamps, counts), in the order of the text
+    """
+    parser = ColumnParser()
+    for chunk in chunks:
+        parser.feed(chunk)
+        if len(parser.timestamps) >= run_size:
+            yield parser.timestamps, parser.counts
+            parser.timestamps, parser.counts = array("q"), array("q")
+    timestamps, counts = parser.close()
+    if len(timestamps):
+        yield timestamps, counts
+
+
+def sort_chunks(chunks: Iterable[bytes], run_size: int = RUN_SIZE, directory=None) -> Iterator[tuple[int, int]]:
+    """
+    Sort records that do not fit in memory (external merge sort): the text (one record 'YYYY-MM-DDThh:mm:ss n'
+    per line) is parsed by runs of run_size records, each run is sorted (unless it already is)
+    and spilled to a temporary file, and the runs are merged back while being read, one block at a time.
+    The last run is not spilled, so an input holding in a single run is sorted in memory.
+    Runs that do not overlap in time (e.g. a sorted input) are read one after the other instead of being merged.
+    Records with the same timestamp keep their order, as with a stable sort.
+
+    :param chunks: an iterable of chunks of bytes
+    :param run_size: the number of records sorted in memory at once
+    :param directory: directory of the temporary files, by default the one of tempfile
+    :return: an iterator of (timestamp in seconds since the epoch, count), sorted by timestamp
+    """
+    with tempfile.TemporaryDirectory(prefix="car_counter_", dir=directory) as temporary:
+        spilled = []  # Paths of the run files
+        bounds = []  # (first timestamp, last timestamp) of the runs
+        last = array("q"), array("q")  # The last run, kept in memory
+        for run in parse_runs(chunks, run_size):
+            if len(last[0]):
+                spilled.append(os.path.join(temporary, f"run_{len(spilled)}"))
+                write_run(spilled[-1], *last)
+            last = CarCounter._sort_columns(*run)
+            del run
+            bounds.append((last[0][0], last[0][-1]))
+
+        runs = [read_run(path) for path in spilled] + [zip(*last)]
+        if all(previous[1] <= following[0] for previous, following in zip(bounds, bounds[1:])):
+            yield from chain.from_iterable(runs)
+        else:
+            yield from merge(*runs, key=itemgetter(0))
+
+
+def read_files(paths: Iterable) -> Iterator[bytes]:
+    """
+    Read files one after the other, by chunks. Compressed files are decompressed (see open_input).
+
+    :param paths: paths to the files
+    :return: an iterator of chunks of bytes, an end of line being added to the files without a final one
+    """
+    for path in paths:
+        chunk = b"\n"
+        with open_input(path) as file:
+            for chunk in read_chunks(file):
+                yield chunk
+        if not chunk.endswith(b"\n"):
+            yield b"\n"
+
+
+@profiled("external", records=lambda args, counter: counter.size)
+def sort_counter(chunks: Iterable[bytes], top_n: int = 3, period: int = 3, run_size: int = RUN_SIZE,
+                 directory=None) -> StreamingCarCounter:
+    """
+    Answer the questions for records larger than the memory, in any order:
+    the records are sorted with an external merge sort (see sort_chunks), and the sorted stream
+    feeds a StreamingCarCounter, which only keeps aggregates.
+
+    :param chunks: an iterable of chunks of bytes, with one record 'YYYY-MM-DDThh:mm:ss n' per line
+    :param top_n: the largest n for which get_top_n can be asked
+    :param period: the n for which get_least_period can be asked
+    :param run_size: the number of records sorted in memory at once
+    :param directory: directory of the temporary files, by default the one of tempfile
+    :return: a StreamingCarCounter with the aggregates of all the records
+    """
+    counter = StreamingCarCounter(top_n=top_n, period=period)
+    add = counter.add
+    for timestamp, count in sort_chunks(chunks, run_size, directory):
+        add(timestamp, count)
+    return counter
@@ -0,0 +1,217 @@
+import os
+from array import array
+from collections.abc import Mapping
+from concurrent.futures import ProcessPoolExecutor
+from itertools import accumulate
+
+from car_counter import CarCounter, ColumnParser, Record, open_input, read_chunks
+from parallel import columns_from_bytes, is_derived, load_columns
+
+
+class CarCounterFleet:
+    """
+    Car counters of many sensors, stored in one shared columnar layout:
+    the records of all the sensors are concatenated in two columns (timestamps and counts),
+    sorted by sensor and then by timestamp, and an offsets column gives where the records of each sensor start.
+    """
+
+    def __init__(self, counters: Mapping[str, CarCounter] = None):
+        """
+        Build a fleet from the counters of its sensors
+
+        :param counters: mapping sensor id -> CarCounter. The columns of the counters are copied.
+        """
+        counters = {} if counters is None else counters
+        self.sensors: list[str] = sorted(counters)
+        """ Sensor ids, sorted """
+        self.timestamps = array("q")
+        """ Timestamps of all the sensors, in seconds since the epoch """
+        self.counts = array("q")
+        """ Car counts of all the sensors, aligned with the timestamps """
+        self.offsets = array("q", [0])
+        """ The records of the i-th sensor are in the index range [offsets[i], offsets[i + 1][ """
+        for sensor in self.sensors:
+            self.timestamps.extend(counters[sensor].timestamps)
+            self.counts.extend(counters[sensor].counts)
+            self.offsets.append(len(self.timestamps))
+        self._index = {sensor: i for i, sensor in enumerate(self.sensors)}
+
+    @classmethod
+    def from_file(cls, path):
+        """
+        Build a fleet from a file with one record 'sensor_id YYYY-MM-DDThh:mm:ss n' per line
+
+        :param path: path to the file
+        :return: a CarCounterFleet
+        """
+        parsers: dict[bytes, ColumnParser] = {}
+        pending = b""
+        with open_input(path) as file:
+            for chunk in read_chunks(file):
+                lines = (pending + chunk).split(b"\n")
+                pending = lines.pop()
+                for line in lines:
+                    cls._parse_line(parsers, line)
+        if pending.strip():
+            cls._parse_line(parsers, pending)
+        return cls({sensor.decode(): CarCounter.from_columns(parser.timestamps, parser.counts)
+                    for sensor, parser in parsers.items()})
+
+    @staticmethod
+    def _parse_line(parsers: dict[bytes, ColumnParser], line: bytes):
+        sensor, _, record = line.partition(b" ")
+        if not record:
+            if not line.strip():
+                return
+            raise ValueError(f"Invalid line {line!r}, expected 'sensor_id YYYY-MM-DDThh:mm:ss n'")
+        parser = parsers.get(sensor)
+        if parser is None:
+            parser = parsers[sensor] = ColumnParser()
+        parser.parse_line(record)
+
+    @classmethod
+    def from_directory(cls, path, workers: int = 1):
+        """
+        Build a fleet from a directory with one file per sensor (see CarCounter.from_file).
+        The sensor id is the file name without its extension. Cache and checkpoint files are skipped (see is_derived).
+
+        :param path: path to the directory
+        :param workers: number of processes parsing the files
+        :return: a CarCounterFleet
+        """
+        names = sorted(name for name in os.listdir(path)
+                       if os.path.isfile(os.path.join(path, name)) and not is_derived(name))
+        sensors = {}
+        for name in names:
+            sensor = os.path.splitext(name)[0]
+            if sensor in sensors:
+                raise ValueError(f"Files {sensors[sensor]} and {name} of {path} are both for the sensor {sensor}")
+            sensors[sensor] = name
+        paths = [os.path.join(path, name) for name in names]
+        if workers > 1:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                columns = list(executor.map(load_columns, paths))
+        else:
+            columns = list(map(load_columns, paths))
+        return cls({sensor: CarCounter.from_sorted_columns(*columns_from_bytes(*data))
+                    for sensor, data in zip(sensors, columns)})
+
+    def __len__(self):
+        return len(self.sensors)
+
+    def counter(self, sensor: str) -> CarCounter:
+        """
+        The counter of a sensor. Its columns are views over the shared columns.
+
+        :param sensor: a sensor id
+        :return: a CarCounter
+        """
+        i = self._index[sensor]
+        start, stop = self.offsets[i], self.offsets[i + 1]
+        return CarCounter.from_sorted_columns(memoryview(self.timestamps)[start:stop],
+                                              memoryview(self.counts)[start:stop])
+
+    def get_total_counts(self) -> dict[str, int]:
+        """
+        Total number of cars of every sensor, computed with one pass over the shared counts
+        :return: mapping sensor id -> number of cars
+        """
+        prefix = array("q", accumulate(self.counts, initial=0))
+        return {sensor: prefix[self.offsets[i + 1]] - prefix[self.offsets[i]] for i, sensor in enumerate(self.sensors)}
+
+    def get_counts_by_date(self, workers: int = 1) -> dict[str, list[tuple[str, int]]]:
+        """
+        Number of cars per day of every sensor (see CarCounter.get_count_by_date)
+        :param workers: number of processes sharing the sensors
+        :return: mapping sensor id -> list of tuples (date as a string, count)
+        """
+        return self._query_one("get_count_by_date", (), workers)
+
+    def get_top_n(self, n: int, workers: int = 1) -> dict[str, list[Record]]:
+        """
+        Top n records of every sensor, including ties (see CarCounter.get_top_n)
+        :param workers: number of processes sharing the sensors
+        :return: mapping sensor id -> list of records
+        """
+        return self._query_one("get_top_n", (n,), workers)
+
+    def get_least_period(self, n: int, workers: int = 1) -> dict[str, list[list[Record]]]:
+        """
+        Periods of n contiguous records with the least cars of every sensor, including ties
+        (see CarCounter.get_least_period)
+        :param workers: number of processes sharing the sensors
+        :return: mapping sensor id -> list of periods
+        """
+        return self._query_one("get_least_period", (n,), workers)
+
+    def answer(self, top_n: int = 3, period: int = 3, workers: int = 1) -> dict[str, tuple[list, list, list]]:
+        """
+        Number of cars per day, top n records and least periods of every sensor, in one batch:
+        with workers > 1, the columns of each sensor are sent once to the pool, which answers all the queries
+
+        :param top_n: the n of get_top_n
+        :param period: the n of get_least_period
+        :param workers: number of processes sharing the sensors
+        :return: mapping sensor id -> (counts by date, top n records, least periods)
+        """
+        queries = [("get_count_by_date", ()), ("get_top_n", (top_n,)), ("get_least_period", (period,))]
+        return {sensor: tuple(answers) for sensor, answers in self._query(queries, workers).items()}
+
+    def _query_one(self, method: str, args: tuple, workers: int) -> dict:
+        return {sensor: answers[0] for sensor, answers in self._query([(method, args)], workers).items()}
+
+    def _query(self, queries: list[tuple[str, tuple]], workers: int) -> dict[str, list]:
+        """
+        Call CarCounter methods on the counter of every sensor, in a pool of processes if workers > 1
+
+        :param queries: the (method name, arguments) to call
+        :param workers: number of processes sharing the sensors
+        :return: mapping sensor id -> results of the queries, in order
+        """
+        if workers <= 1 or len(self.sensors) <= 1:
+            return {sensor: _answer(self.counter(sensor), queries) for sensor in self.sensors}
+        # Groups of sensors (round robin), one task per group
+        groups = [self.sensors[i::workers] for i in range(workers)]
+        tasks = [[(sensor, *self._sensor_bytes(sensor)) for sensor in group] for group in groups if group]
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = dict(pair for result in executor.map(_query_sensors, tasks, [queries] * len(tasks))
+                           for pair in result)
+        return {sensor: results[sensor] for sensor in self.sensors}
+
+    def _sensor_bytes(self, sensor: str) -> tuple[bytes, bytes]:
+        counter = self.counter(sensor)
+        return counter.timestamps.tobytes(), counter.counts.tobytes()
+
+    def combined(self) -> CarCounter:
+        """
+        Fleet-wide counter: the counts of all the sensors added timestamp by timestamp
+        :return: a CarCounter
+        """
+        totals: dict[int, int] = {}
+        for timestamp, count in zip(self.timestamps, self.counts):
+            totals[timestamp] = totals.get(timestamp, 0) + count
+        timestamps = sorted(totals)
+        return CarCounter.from_sorted_columns(array("q", timestamps), array("q", map(totals.__getitem__, timestamps)))
+
+    def get_total_count(self) -> int:
+        """
+        Total number of cars over all the sensors
+        :return: number of cars
+        """
+        return sum(self.counts)
+
+    def get_busiest_periods(self, n: int) -> list[Record]:
+        """
+        The n timestamps (half hours) with the most cars over all the sensors, including ties
+        :return: a list of records, the count being the sum over all the sensors
+        """
+        return self.combined().get_top_n(n)
+
+
+def _answer(counter: CarCounter, queries: list[tuple[str, tuple]]) -> list:
+    return [getattr(counter, method)(*args) for method, args in queries]
+
+
+def _query_sensors(sensors: list[tuple[str, bytes, bytes]], queries: list[tuple[str, tuple]]) -> list[tuple[str, list]]:
+    return [(sensor, _answer(CarCounter.from_sorted_columns(*columns_from_bytes(timestamps, counts)), queries))
+            for sensor, timestamps, counts in sensors]
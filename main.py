@@ -1,37 +1,233 @@
+import argparse
+import asyncio
+import os
 import sys
-from car_counter import Record as TS
 from car_counter import CarCounter as CC
+from car_counter import compression_of, open_input, read_chunks
+from external import read_files, sort_counter
+from fleet import CarCounterFleet
+from parallel import default_workers, expand_paths, load_files, load_gzip, process_file
+from profiling import Profiler
+from server import CarCounterServer
+from streaming import StreamingCarCounter as SCC
+from streaming import update_checkpoint
 
-if __name__ == "__main__":
 
-    if len(sys.argv) != 2:
-        print("AIPS Coding challenge")
-        print("Invoke me with:")
-        print("  python main.py <file>")
-        exit(0)
+def print_report(cc):
+    """
+    Print the answers to the four questions
+
+    :param cc: a CarCounter or a StreamingCarCounter
+    """
+    print_answers(cc.get_total_count(), cc.get_count_by_date(), cc.get_top_n(3), cc.get_least_period(3))
+
+
+def print_answers(total, count_by_date, top, least_periods):
+    """
+    Print the answers to the four questions
+
+    :param total: the total number of cars
+    :param count_by_date: the list of tuples (date, count)
+    :param top: the top 3 records
+    :param least_periods: the 1.5 hour periods with least cars
+    """
+    print(f"Total number of cars: {total}")
+
+    print("\nNumber of cars per day:")
+    for (date, count) in count_by_date:
+        print(f"{date} {count}")
+
+    print("\nThe top 3 half hours with most cars (may be longer due to ties):")
+    for ts in top:
+        print(ts)
+
+    print("\nThe 1.5 hour period with least cars (maybe more than one period due to ties):")
+    for period in least_periods:
+        print(f"{period[0].timestamp} -- {period[-1].timestamp} {CC.total_count(period)}")
+
+
+def print_fleet_report(fleet, workers: int):
+    """
+    Print the answers to the four questions for every sensor of a fleet, and then for the whole fleet
+
+    :param fleet: a CarCounterFleet
+    :param workers: number of processes sharing the sensors
+    """
+    totals = fleet.get_total_counts()
+    answers = fleet.answer(3, 3, workers)
+    for sensor in fleet.sensors:
+        print(f"=== Sensor {sensor} ===")
+        print_answers(totals[sensor], *answers[sensor])
+        print()
+
+    print(f"=== All {len(fleet)} sensors ===")
+    print(f"Total number of cars: {fleet.get_total_count()}")
+    print("\nThe top 3 half hours with most cars over all the sensors (may be longer due to ties):")
+    for ts in fleet.get_busiest_periods(3):
+        print(ts)
+
+
+def parse_arguments(argv: list[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="AIPS Coding challenge")
+    parser.add_argument("files", nargs="*", metavar="file",
+                        help="the input file, or '-' to read the standard input. Several files, glob patterns "
+                             "or directories can be given, their records being merged. Files may be compressed "
+                             "with gzip, bzip2 or xz. Optional with --serve")
+    parser.add_argument("--fleet", action="store_true",
+                        help="the input holds many sensors: either a file with one record 'sensor_id "
+                             "YYYY-MM-DDThh:mm:ss n' per line, or a directory with one file per sensor")
+    parser.add_argument("--stream", action="store_true",
+                        help="process the records one at a time, in constant memory. "
+                             "The records must be sorted by timestamp. Reading '-' always streams the records")
+    parser.add_argument("--workers", type=int,
+                        help="number of processes sharing the work on a file (default: 1), "
+                             "or parsing the files when several are given (default: one per file, up to the number "
+                             "of CPUs). A single file should be sorted by timestamp")
+    parser.add_argument("--external", action="store_true",
+                        help="sort the records by runs spilled to temporary files, and merge them while streaming "
+                             "them: for unsorted inputs larger than the memory")
+    parser.add_argument("--checkpoint", action="store_true",
+                        help="keep the aggregates of the records read so far in <file>.checkpoint, so that the next "
+                             "runs only parse the records appended to the file. The records must be sorted by timestamp")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="do not use nor write the binary cache file (<file>.cache) of the input")
+    parser.add_argument("--serve", metavar="ADDRESS",
+                        help="serve live readings and queries on a TCP ('host:port', or ':port' on localhost) "
+                             "or Unix (path) socket, starting from the records of the file if any. "
+                             "See server.CarCounterServer for the protocol")
+    parser.add_argument("--profile", metavar="JSON",
+                        help="write the wall time and number of records of each phase (parse, sort, grouping, top n, "
+                             "least period...) as JSON to this file, or to the standard error with '-'")
+    parser.add_argument("--profile-memory", action="store_true",
+                        help="with --profile, also measure the peak memory of each phase (slows the run down)")
+    args = parser.parse_args(argv)
+    if not args.files and args.serve is None:
+        parser.error("the file is required, unless serving with --serve")
+    if len(args.files) > 1 and ("-" in args.files or args.fleet):
+        parser.error("only one input can be given with '-' or --fleet")
+    if args.checkpoint and (len(args.files) != 1 or "-" in args.files or args.fleet):
+        parser.error("--checkpoint needs a single input file")
+    # A single input file, or the files to merge
+    paths = args.files if args.fleet or args.files == ["-"] else expand_paths(args.files)
+    if len(args.files) <= 1 and paths == args.files:
+        args.file, args.paths = (args.files[0] if args.files else None), None
+    elif not paths:
+        parser.error(f"no input file in {' '.join(args.files)}")
     else:
-        # Read the input file in a list of timestamp
-        timestamp_list = []
-        with open(sys.argv[1]) as records:
-            for line in records:
-                timestamp_list.append(TS.from_string(line))
+        args.file, args.paths = None, paths
+    if args.workers is None:
+        args.workers = default_workers(args.paths) if args.paths is not None else 1
+    return args
 
-        # Build a car counter with the list
-        cc = CC(timestamp_list)
 
-        # Output
-        print(f"Total number of cars: {cc.get_total_count()}")
+def run(args: argparse.Namespace):
+    """
+    Answer the questions for the input given by the command line arguments
+    :param args: the parsed arguments
+    """
+    if args.serve is not None:
+        # Keep the aggregates up to date with the readings sent by the clients
+        if args.paths is not None:
+            cc = SCC.from_counter(load_files(args.paths, args.workers), top_n=3, period=3)
+        else:
+            cc = SCC(top_n=3, period=3)
+        if args.file is not None:
+            try:
+                with open_input(args.file) as file:
+                    cc.consume_chunks(read_chunks(file))
+            except ValueError as e:
+                sys.exit(f"Error: {e}")
+        try:
+            asyncio.run(CarCounterServer(cc).serve(args.serve))
+        except KeyboardInterrupt:
+            pass
+        return
+    elif args.fleet:
+        # Many sensors: answer for each of them, and for the whole fleet
+        try:
+            if os.path.isdir(args.file):
+                fleet = CarCounterFleet.from_directory(args.file, args.workers)
+            else:
+                fleet = CarCounterFleet.from_file(args.file)
+        except ValueError as e:
+            sys.exit(f"Error: {e}")
+        print_fleet_report(fleet, args.workers)
+        return
+    elif args.external:
+        # Sort the records out of memory, and stream them sorted in a counter only keeping aggregates
+        chunks = read_chunks(sys.stdin.buffer) if args.file == "-" else read_files(args.paths or [args.file])
+        cc = sort_counter(chunks, top_n=3, period=3)
+    elif args.paths is not None:
+        if args.stream:
+            # Merge the records of the files while streaming them
+            cc = SCC(top_n=3, period=3)
+            try:
+                cc.consume_files(args.paths)
+            except ValueError as e:
+                sys.exit(f"Error: {e}")
+        else:
+            # Parse the files concurrently, and merge their sorted records
+            cc = load_files(args.paths, args.workers)
+    elif args.checkpoint:
+        # Only parse the records appended since the previous run
+        try:
+            cc = update_checkpoint(args.file, top_n=3, period=3)
+        except (ValueError, IndexError) as e:
+            print(f"Cannot process the file incrementally ({e}), processing it at once", file=sys.stderr)
+            try:
+                cc = CC.from_file(args.file)
+            except (ValueError, IndexError) as e:
+                sys.exit(f"Error: {e}")
+    elif args.file == "-" or args.stream:
+        # Stream the records in a counter only keeping aggregates
+        cc = SCC(top_n=3, period=3)
+        try:
+            if args.file == "-":
+                cc.consume_chunks(read_chunks(sys.stdin.buffer))
+            else:
+                with open_input(args.file) as file:
+                    cc.consume_chunks(read_chunks(file))
+        except ValueError as e:
+            sys.exit(f"Error: {e}")
+    elif args.workers > 1 and compression_of(args.file) == "gzip":
+        # Decompress the members of the file in parallel, if it has several
+        cc = load_gzip(args.file, args.workers)
+    elif args.workers > 1 and compression_of(args.file) is None:
+        # Split the file in shards processed in parallel
+        try:
+            cc = process_file(args.file, args.workers, top_n=3, period=3)
+        except ValueError as e:
+            print(f"Cannot process the file in parallel ({e}), processing it at once", file=sys.stderr)
+            cc = CC.from_file(args.file)
+    elif args.no_cache:
+        # Read the input file straight into a car counter
+        cc = CC.from_file(args.file)
+    else:
+        # Open the binary cache of the input file, (re)building it if it is missing or older than the file
+        cc = CC.from_cached_file(args.file)
 
-        print("\nNumber of cars per day:")
-        for (date, count) in cc.get_count_by_date():
-            print(f"{date} {count}")
+    print_report(cc)
 
-        print("\nThe top 3 half hours with most cars (may be longer due to ties):")
-        for ts in cc.get_top_n(3):
-            print(ts)
 
-        print("\nThe 1.5 hour period with least cars (maybe more than one period due to ties):")
-        for period in cc.get_least_period(3):
-            print(f"{period[0].timestamp} -- {period[-1].timestamp} {cc.total_count(period)}")
+if __name__ == "__main__":
+
+    if len(sys.argv) == 1:
+        print("AIPS Coding challenge")
+        print("Invoke me with:")
+        print("  python main.py <file>")
+        print("  python main.py - < <file>")
+        exit(0)
+    else:
+        args = parse_arguments(sys.argv[1:])
 
-        
+        if args.profile is None:
+            run(args)
+        else:
+            # Record the phases of the run, and write them as JSON once the answers are printed
+            with Profiler(memory=args.profile_memory) as profiler:
+                run(args)
+            if args.profile == "-":
+                profiler.dump(sys.stderr)
+            else:
+                with open(args.profile, "w") as file:
+                    profiler.dump(file)
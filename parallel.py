@@ -0,0 +1,298 @@
+import glob
+import mmap
+import os
+import zlib
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, Iterator
+
+from car_counter import CarCounter, ColumnParser, READ_CHUNK_SIZE
+from profiling import profiled
+from streaming import CHECKPOINT_SUFFIX, StreamingCarCounter
+
+
+def split_file(path, shards: int) -> list[tuple[int, int]]:
+    """
+    Split a file in byte ranges aligned on line boundaries
+
+    :param path: path to the file
+    :param shards: the wanted number of ranges
+    :return: a list of (start, stop) byte offsets, covering the file in order. May have less than 'shards' items.
+    """
+    size = os.path.getsize(path)
+    bounds = [0]
+    with open(path, "rb") as file:
+        for i in range(1, shards):
+            offset = size * i // shards
+            if offset <= bounds[-1]:
+                continue
+            # Move to the start of the next line
+            file.seek(offset - 1)
+            file.readline()
+            offset = file.tell()
+            if bounds[-1] < offset < size:
+                bounds.append(offset)
+    bounds.append(size)
+    return [(start, stop) for start, stop in zip(bounds, bounds[1:]) if start < stop]
+
+
+def read_range(path, start: int, stop: int, chunk_size: int = READ_CHUNK_SIZE) -> Iterator[bytes]:
+    """
+    Read a byte range of a file by chunks
+
+    :param path: path to the file
+    :param start: offset of the first byte
+    :param stop: offset after the last byte
+    :param chunk_size: the size of the chunks
+    :return: an iterator over the chunks
+    """
+    with open(path, "rb") as file:
+        file.seek(start)
+        while start < stop:
+            chunk = file.read(min(chunk_size, stop - start))
+            if not chunk:
+                break
+            start += len(chunk)
+            yield chunk
+
+
+def process_shard(path, start: int, stop: int, top_n: int, period: int) -> StreamingCarCounter:
+    """
+    Compute the partial aggregates of a byte range of a file
+
+    :param path: path to the file
+    :param start: offset of the first byte, at the start of a line
+    :param stop: offset after the last byte, at the start of a line (or the end of the file)
+    :param top_n: the largest n for which the top n will be asked
+    :param period: the n for which the least period will be asked
+    :return: a StreamingCarCounter holding the partial aggregates of the range
+    """
+    counter = CarCounter.from_columns(*ColumnParser.parse_chunks(read_range(path, start, stop)))
+    return StreamingCarCounter.from_counter(counter, top_n=top_n, period=period)
+
+
+@profiled("parallel", records=lambda args, counter: counter.size)
+def process_file(path, workers: int, top_n: int = 3, period: int = 3) -> StreamingCarCounter:
+    """
+    Process a file in parallel: the file is split in shards, whose partial aggregates
+    are computed in a pool of processes and then merged.
+    The records of a shard are sorted if needed, but the shards must not overlap in time,
+    which is the case when the file is sorted by timestamp.
+
+    :param path: path to the file
+    :param workers: number of processes
+    :param top_n: the largest n for which the top n will be asked
+    :param period: the n for which the least period will be asked
+    :return: a StreamingCarCounter giving the same answers as a CarCounter built from the file
+    :raise ValueError: if shards overlap in time
+    """
+    shards = split_file(path, workers)
+    if len(shards) <= 1:
+        return process_shard(path, 0, os.path.getsize(path), top_n, period)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        partials = list(executor.map(process_shard, *zip(*[(path, start, stop, top_n, period)
+                                                            for start, stop in shards])))
+    result = partials[0]
+    for partial in partials[1:]:
+        result.merge(partial)
+    return result
+
+
+DERIVED_SUFFIXES = (".cache", CHECKPOINT_SUFFIX)
+"""
+Suffixes of the files written next to the input files (see CarCounter.from_cached_file and update_checkpoint).
+"""
+
+
+def is_derived(path) -> bool:
+    """
+    :return: whether a file was written next to an input file (cache or checkpoint), rather than being an input
+    """
+    return str(path).endswith(DERIVED_SUFFIXES)
+
+
+def expand_paths(patterns: Iterable[str]) -> list[str]:
+    """
+    List the input files given as paths, glob patterns or directories
+
+    :param patterns: paths of files, glob patterns (e.g. 'data/2016-*.txt'), or directories.
+           The files of a directory or matching a pattern are taken in name order (not recursively),
+           except the cache and checkpoint files (see is_derived).
+    :return: the paths of the files, in the order of the patterns, without duplicates
+    """
+    paths = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            names = sorted(name for name in os.listdir(pattern) if not is_derived(name))
+            paths.extend(path for path in (os.path.join(pattern, name) for name in names) if os.path.isfile(path))
+        elif any(character in pattern for character in "*?["):
+            paths.extend(path for path in sorted(glob.glob(pattern))
+                         if os.path.isfile(path) and not is_derived(path))
+        else:
+            paths.append(pattern)
+    return list(dict.fromkeys(paths))
+
+
+def load_columns(path) -> tuple[bytes, bytes]:
+    """
+    Parse a file (see CarCounter.from_file) into sorted columns, as bytes to be sent between processes
+
+    :param path: path to the file
+    :return: the tuple of columns (timestamps, counts) as bytes of 64 bits integers
+    """
+    counter = CarCounter.from_file(path)
+    return counter.timestamps.tobytes(), counter.counts.tobytes()
+
+
+def columns_from_bytes(timestamps: bytes, counts: bytes) -> tuple[array, array]:
+    """
+    :return: the columns given by load_columns, as arrays
+    """
+    result = array("q"), array("q")
+    result[0].frombytes(timestamps)
+    result[1].frombytes(counts)
+    return result
+
+
+def default_workers(paths: list) -> int:
+    """
+    :return: the default number of processes parsing several files: one per file, up to the number of CPUs
+    """
+    return max(min(len(paths), os.cpu_count() or 1), 1)
+
+
+def load_files(paths: Iterable, workers: int = None) -> CarCounter:
+    """
+    Build a CarCounter from several files. The files are parsed concurrently in a pool of processes,
+    each one being sorted only if needed, and the sorted columns are merged (see CarCounter.from_runs).
+
+    :param paths: paths to the files
+    :param workers: number of processes parsing the files. Default to one per file, up to the number of CPUs
+    :return: a CarCounter with the records of all the files
+    """
+    paths = list(paths)
+    workers = default_workers(paths) if workers is None else workers
+    if workers > 1 and len(paths) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            runs = [columns_from_bytes(*columns) for columns in executor.map(load_columns, paths)]
+    else:
+        runs = [(counter.timestamps, counter.counts) for counter in map(CarCounter.from_file, paths)]
+    return CarCounter.from_runs(runs)
+
+
+GZIP_MEMBER_MAGIC = b"\x1f\x8b\x08"
+"""
+First bytes of a gzip member (magic bytes and deflate method).
+"""
+
+
+def split_gzip(path, shards: int, probe_size: int = 1 << 16) -> list[tuple[int, int]]:
+    """
+    Split a multi-member gzip file (e.g. concatenated gzip files) in byte ranges starting on members.
+    The magic bytes of a member may also appear within the compressed data: a candidate start is only kept if
+    the start of its data can be decompressed, and process_gzip_range checks that the ranges do end on members.
+
+    :param path: path to the file
+    :param shards: the wanted number of ranges
+    :param probe_size: number of bytes decompressed to check a candidate start
+    :return: a list of (start, stop) byte offsets, covering the file in order. May have less than 'shards' items.
+    """
+    size = os.path.getsize(path)
+    bounds = [0]
+    if size == 0:
+        return []
+    with open(path, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        for i in range(1, shards):
+            offset = max(size * i // shards, bounds[-1] + 1)
+            while (offset := mapped.find(GZIP_MEMBER_MAGIC, offset)) >= 0:
+                try:
+                    zlib.decompressobj(31).decompress(mapped[offset:offset + probe_size])
+                    break
+                except zlib.error:
+                    offset += 1
+            if offset < 0:
+                break
+            bounds.append(offset)
+    bounds.append(size)
+    return list(zip(bounds, bounds[1:]))
+
+
+def process_gzip_range(path, start: int, stop: int, chunk_size: int = READ_CHUNK_SIZE):
+    """
+    Decompress and parse the gzip members of a byte range of a file.
+    Lines may be split between ranges: the incomplete first and last lines of the range are returned as text.
+
+    :param path: path to the file
+    :param start: offset of the first byte, at the start of a member
+    :param stop: offset after the last byte, at the end of a member
+    :param chunk_size: the size of the chunks read
+    :return: None if the range does not start or end on members, or a tuple
+        (text up to the first end of line, whether this text has an end of line,
+        timestamps and counts as bytes (see columns_from_bytes) of the next lines, sorted, incomplete last line).
+        The text up to the first end of line is empty for the first range, as it starts on a line.
+    """
+    parser = ColumnParser()
+    head = b""
+    in_head = start > 0  # The text up to the first end of line may end a line of the previous range
+    decompressor = zlib.decompressobj(31)
+    in_member = False
+    try:
+        for data in read_range(path, start, stop, chunk_size):
+            while data:
+                text = decompressor.decompress(data)
+                in_member = not decompressor.eof
+                data = decompressor.unused_data
+                if decompressor.eof:
+                    decompressor = zlib.decompressobj(31)
+                if in_head:
+                    head += text
+                    end = head.find(b"\n")
+                    if end < 0:
+                        continue
+                    head, text, in_head = head[:end + 1], head[end + 1:], False
+                parser.feed(text)
+    except zlib.error:
+        return None
+    if in_member:
+        # The range ends within a member
+        return None
+    counter = CarCounter.from_columns(parser.timestamps, parser.counts)
+    return head, not in_head, counter.timestamps.tobytes(), counter.counts.tobytes(), parser.pending
+
+
+@profiled("parallel", records=lambda args, counter: len(counter))
+def load_gzip(path, workers: int) -> CarCounter:
+    """
+    Load a multi-member gzip file (e.g. gzip files concatenated, or written by pigz or bgzip) in parallel:
+    the members are shared between processes, which decompress and parse them, and the sorted columns are merged
+    (see CarCounter.from_runs). The file is decompressed at once if it has a single member,
+    or if the ranges do not split it on members.
+
+    :param path: path to the file
+    :param workers: number of processes
+    :return: a CarCounter object
+    """
+    shards = split_gzip(path, workers)
+    if len(shards) <= 1:
+        return CarCounter.from_file(path)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        partials = list(executor.map(process_gzip_range, *zip(*((path, start, stop) for start, stop in shards))))
+    if None in partials:
+        return CarCounter.from_file(path)
+
+    def parse(text: bytes) -> tuple[array, array]:
+        counter = CarCounter.from_columns(*ColumnParser.parse_chunks([text]))
+        return counter.timestamps, counter.counts
+
+    # The lines split between ranges are parsed apart, and their records are merged with the others
+    runs = []
+    incomplete = b""
+    for head, complete, timestamps, counts, tail in partials:
+        if not complete:
+            incomplete += head
+            continue
+        runs.append(parse(incomplete + head))
+        runs.append(columns_from_bytes(timestamps, counts))
+        incomplete = tail
+    runs.append(parse(incomplete))
+    return CarCounter.from_runs(runs)
@@ -0,0 +1,130 @@
+import functools
+import json
+import time
+import tracemalloc
+from typing import Callable
+
+
+class Profiler:
+    """
+    Record the wall time, the number of records and optionally the peak memory of the phases of a run.
+    A profiler records the phases (see profiled) while it is active, i.e. within a 'with profiler:' block.
+    When no profiler is active, a profiled function costs one attribute lookup.
+    """
+
+    active: "Profiler | None" = None
+    """ The active profiler, if any """
+
+    def __init__(self, memory: bool = False):
+        """
+        :param memory: also trace the allocations (with tracemalloc) to measure the peak memory of the phases.
+               Tracing slows the phases down, so their times are only comparable between runs with the same setting.
+        """
+        self.memory = memory
+        self.phases: list[dict] = []
+        """ The recorded phases, in the order they started """
+        self._stack: list[dict] = []
+        self._previous = None
+        self._started_tracing = False
+        self._start = None
+        self.seconds = None
+        """ Wall time of the whole 'with' block """
+
+    def __enter__(self):
+        self._previous, Profiler.active = Profiler.active, self
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.seconds = time.perf_counter() - self._start
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+        Profiler.active = self._previous
+
+    def start(self, name: str) -> dict:
+        """
+        Start a phase, within the current one if any
+        :param name: the name of the phase
+        :return: the record of the phase
+        """
+        phase = {"name": name, "depth": len(self._stack)}
+        if self.memory:
+            current, peak = tracemalloc.get_traced_memory()
+            if self._stack:
+                self._stack[-1]["_peak"] = max(self._stack[-1]["_peak"], peak)
+            tracemalloc.reset_peak()
+            phase["_current"], phase["_peak"] = current, current
+        self.phases.append(phase)
+        self._stack.append(phase)
+        phase["_start"] = time.perf_counter()
+        return phase
+
+    def stop(self, phase: dict, records: int = None):
+        """
+        Stop the current phase
+        :param phase: the record of the phase, as returned by start
+        :param records: the number of records handled by the phase, if known
+        """
+        phase["seconds"] = time.perf_counter() - phase.pop("_start")
+        self._stack.pop()
+        if records is not None:
+            phase["records"] = records
+        if self.memory:
+            _, peak = tracemalloc.get_traced_memory()
+            peak = max(phase.pop("_peak"), peak)
+            phase["peak_bytes"] = peak - phase.pop("_current")
+            if self._stack:
+                # The peak of the phase is also reached within the enclosing phase
+                self._stack[-1]["_peak"] = max(self._stack[-1]["_peak"], peak)
+
+    def report(self) -> dict:
+        """
+        :return: the recorded phases, as a dict ready to be dumped as JSON
+        """
+        return {"seconds": self.seconds, "memory": self.memory, "phases": self.phases}
+
+    def dump(self, file):
+        """
+        Write the report as JSON
+        :param file: a text file
+        """
+        json.dump(self.report(), file, indent=2)
+        file.write("\n")
+
+
+def _first_length(args: tuple, result) -> int:
+    return len(args[0])
+
+
+def profiled(name: str, records: Callable[[tuple, object], int] = _first_length):
+    """
+    Decorator recording the calls of a function as phases of the active profiler, if any
+
+    :param name: the name of the phase
+    :param records: function of the arguments and the result of a call giving the number of records it handled.
+           By default, the length of the first argument (e.g. the counter of a method).
+    :return: the decorator
+    """
+
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            profiler = Profiler.active
+            if profiler is None:
+                return function(*args, **kwargs)
+            phase = profiler.start(name)
+            try:
+                result = function(*args, **kwargs)
+            except BaseException:
+                profiler.stop(phase)
+                raise
+            profiler.stop(phase, records(args, result))
+            return result
+
+        return wrapper
+
+    return decorator
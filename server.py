@@ -0,0 +1,136 @@
+import asyncio
+import sys
+
+from car_counter import CarCounter, Record
+from streaming import StreamingCarCounter
+
+COMMANDS = ("TOTAL", "DAYS", "TOP", "LEAST", "SIZE", "QUIT")
+"""
+Query commands of the server, besides the readings. See CarCounterServer.execute.
+"""
+
+END = "END"
+"""
+Line ending the answers of the queries.
+"""
+
+
+class CarCounterServer:
+    """
+    Live ingestion server: readings are received as lines 'YYYY-MM-DDThh:mm:ss n' over TCP or Unix sockets,
+    and added to a StreamingCarCounter, whose aggregates answer the queries without rescanning the readings.
+    All the clients share the same counter, the readings must come in time order.
+
+    Every line gets an answer:
+    * a reading: 'OK', or 'ERROR message' if it is invalid or out of order,
+    * 'TOTAL': the total number of cars,
+    * 'SIZE': the number of readings,
+    * 'DAYS': one 'YYYY-MM-DD count' line per day, then 'END',
+    * 'TOP [n]': the top n readings (n defaults to the top_n of the counter), then 'END',
+    * 'LEAST': the least periods 'start -- end count', then 'END',
+    * 'QUIT': 'BYE', and the connection is closed.
+    """
+
+    def __init__(self, counter: StreamingCarCounter = None):
+        """
+        :param counter: the counter holding the aggregates, possibly with readings already. Default to a new one.
+        """
+        self.counter = StreamingCarCounter() if counter is None else counter
+        self.servers: list[asyncio.AbstractServer] = []
+
+    def execute(self, line: str) -> list[str]:
+        """
+        Execute a line received from a client
+
+        :param line: a reading or a query command
+        :return: the lines of the answer
+        """
+        words = line.split()
+        if not words:
+            return []
+        command = words[0].upper()
+        try:
+            if command not in COMMANDS:
+                record = Record.from_string(line.strip())
+                self.counter.add(record.seconds, record.car_count)
+                return ["OK"]
+            elif command == "TOTAL":
+                return [str(self.counter.get_total_count())]
+            elif command == "SIZE":
+                return [str(self.counter.size)]
+            elif command == "DAYS":
+                return [f"{date} {count}" for date, count in self.counter.get_count_by_date()] + [END]
+            elif command == "TOP":
+                n = int(words[1]) if len(words) > 1 else None
+                return [str(record) for record in self.counter.get_top_n(n)] + [END]
+            elif command == "LEAST":
+                return [f"{period[0].timestamp} -- {period[-1].timestamp} {CarCounter.total_count(period)}"
+                        for period in self.counter.get_least_period()] + [END]
+            else:
+                return ["BYE"]
+        except (ValueError, IndexError, TypeError, OverflowError) as e:
+            return [f"ERROR {e}"]
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """
+        Serve a client until it quits or closes the connection
+        """
+        try:
+            while line := await reader.readline():
+                answer = self.execute(line.decode(errors="replace"))
+                if answer:
+                    writer.write("".join(f"{answer_line}\n" for answer_line in answer).encode())
+                    await writer.drain()
+                if answer == ["BYE"]:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def start_tcp(self, host: str = "127.0.0.1", port: int = 0) -> asyncio.AbstractServer:
+        """
+        Start listening on a TCP socket
+
+        :param host: the interface
+        :param port: the port, 0 for any free port
+        :return: the asyncio server, whose 'sockets' give the actual address
+        """
+        server = await asyncio.start_server(self.handle, host, port)
+        self.servers.append(server)
+        return server
+
+    async def start_unix(self, path) -> asyncio.AbstractServer:
+        """
+        Start listening on a Unix socket
+
+        :param path: path of the socket
+        :return: the asyncio server
+        """
+        server = await asyncio.start_unix_server(self.handle, path)
+        self.servers.append(server)
+        return server
+
+    async def serve(self, address: str):
+        """
+        Listen on an address and serve the clients forever
+
+        :param address: 'host:port' (or ':port' for localhost) for TCP, or the path of a Unix socket
+        """
+        host, separator, port = address.rpartition(":")
+        if separator and port.isdigit():
+            server = await self.start_tcp(host or "127.0.0.1", int(port))
+        else:
+            server = await self.start_unix(address)
+        for socket in server.sockets:
+            print(f"Listening on {socket.getsockname()}", file=sys.stderr)
+        async with server:
+            await server.serve_forever()
+
+    def close(self):
+        """
+        Stop listening
+        """
+        for server in self.servers:
+            server.close()
+        self.servers = []
@@ -0,0 +1,551 @@
+import datetime
+import json
+import os
+from collections import deque
+from heapq import heappop, heappush, merge, nlargest
+from itertools import compress, repeat
+from operator import ge, itemgetter
+from typing import Iterable, Iterator
+
+from car_counter import CarCounter, ColumnParser, Record, SECONDS_PER_DAY, day_to_string, from_seconds
+from car_counter import open_input, read_chunks
+from profiling import profiled
+
+CHECKPOINT_SUFFIX = ".checkpoint"
+"""
+Suffix of the checkpoint files, next to the input files (see update_checkpoint).
+"""
+
+CHECKPOINT_VERSION = 1
+"""
+Version of the checkpoint format, checked when loading a checkpoint.
+"""
+
+CHECKPOINT_FINGERPRINT_SIZE = 64
+"""
+Number of bytes before the checkpoint offset kept to check that the input was only appended to.
+"""
+
+
+class TopN:
+    """
+    Bounded, tie-aware selection of the items with the n largest counts.
+
+    Items are kept in buckets by count, and a min-heap gives the smallest kept count.
+    A bucket is dropped as soon as the other buckets hold at least n items,
+    so that the kept items are exactly the ones CarCounter.get_top_n would pick (ties included).
+    """
+
+    def __init__(self, n: int):
+        """
+        TopN constructor
+
+        :param n: the number of items to select. Ties may lead to more than n items being kept.
+        """
+        self.n = n
+        self._heap: list[int] = []  # Counts of the buckets, smallest on top
+        self._buckets: dict[int, list] = {}  # count -> items with this count, in insertion order
+        self._size = 0  # Number of items in the buckets
+
+    def __len__(self):
+        return self._size
+
+    def push(self, count: int, item):
+        """
+        Offer an item to the selection
+
+        :param count: the count of the item, used for the selection
+        :param item: the item
+        """
+        if self.n <= 0 or (self._size >= self.n and count < self._heap[0]):
+            return
+        bucket = self._buckets.get(count)
+        if bucket is None:
+            self._buckets[count] = [item]
+            heappush(self._heap, count)
+        else:
+            bucket.append(item)
+        self._size += 1
+        # Drop the smallest bucket while the other ones are enough to select n items
+        while self._size - len(self._buckets[self._heap[0]]) >= self.n:
+            self._size -= len(self._buckets.pop(heappop(self._heap)))
+
+    def counted_items(self) -> Iterator[tuple[int, object]]:
+        """
+        All the items kept by the selection, with their count
+
+        :return: an iterator over tuples (count, item)
+        """
+        for count, bucket in self._buckets.items():
+            for item in bucket:
+                yield count, item
+
+    def merge(self, other: "TopN"):
+        """
+        Offer all the items kept by another selection
+
+        :param other: a TopN object
+        """
+        for count, item in other.counted_items():
+            self.push(count, item)
+
+    def items(self, n: int = None) -> list:
+        """
+        The selected items, by decreasing count (insertion order for a same count)
+
+        :param n: select the top n <= self.n items instead of the top self.n
+        :return: a list of items. It may have more than n items due to ties.
+        """
+        n = self.n if n is None else n
+        if n > self.n:
+            raise ValueError(f"This selection only keeps the top {self.n} items, {n} asked")
+        result = []
+        for count in sorted(self._buckets, reverse=True):
+            if len(result) >= n:
+                break
+            result += self._buckets[count]
+        return result
+
+
+class StreamingCarCounter:
+    """
+    Car counter answering the same questions as CarCounter over a stream of records given in time order.
+    Only aggregates are kept: the memory used depends on the number of days and ties, not on the number of records.
+    """
+
+    time_resolution = CarCounter.time_resolution
+    """
+    Default time resolution of the counters, shared with CarCounter. Can be set per counter at construction.
+    """
+
+    def __init__(self, top_n: int = 3, period: int = 3, time_resolution: datetime.timedelta = None):
+        """
+        Build an empty StreamingCarCounter
+
+        :param top_n: the largest n for which get_top_n can be asked
+        :param period: the n for which get_least_period can be asked
+        :param time_resolution: the time resolution of the counter, if not the default one
+        """
+        if time_resolution is not None and time_resolution != type(self).time_resolution:
+            self.time_resolution = time_resolution
+        self.top_n = top_n
+        self.period = period
+        self.size = 0
+        """ Number of records """
+        self.total = 0
+        """ Total number of cars """
+        self.days: dict[int, int] = {}
+        """ Day since the epoch -> number of cars that day """
+        self.top = TopN(top_n)
+        """ Candidates (timestamp, count, record number) for the top n records """
+        self.least_count = 0
+        """ Number of cars in the least periods """
+        self.least_periods: list[tuple[tuple[int, int], ...]] = []
+        """ Least periods found so far, each one being a tuple of (timestamp, count) """
+        self.first: int = None
+        """ Timestamp of the first record """
+        self.last: int = None
+        """ Timestamp of the last record """
+        self.head: list[tuple[int, int]] = []
+        """ First (timestamp, count) records, up to period - 1 of them """
+        self.tail: deque[tuple[int, int]] = deque(maxlen=max(period - 1, 0))
+        """ Last (timestamp, count) records, up to period - 1 of them """
+        self._window: deque[tuple[int, int]] = deque(maxlen=period)  # Last records of the current contiguous run
+        self._window_count = 0  # Number of cars in the window
+        self._step = int(self.time_resolution.total_seconds())
+
+    @classmethod
+    def from_counter(cls, counter: CarCounter, top_n: int = 3, period: int = 3) -> "StreamingCarCounter":
+        """
+        Build the aggregates of a CarCounter at once, with its column operations,
+        as if all its records had been added one at a time.
+
+        :param counter: a CarCounter
+        :param top_n: the largest n for which get_top_n can be asked
+        :param period: the n for which get_least_period can be asked
+        :return: a StreamingCarCounter
+        """
+        result = cls(top_n=top_n, period=period, time_resolution=counter.time_resolution)
+        if len(counter) == 0:
+            return result
+        timestamps = counter.timestamps
+        counts = counter.counts
+
+        result.size = len(counter)
+        result.total = counter.get_total_count()
+        result.days = {day: counter.range_count(start, stop) for day, start, stop in counter.date_ranges()}
+        if top_n > 0:
+            threshold = nlargest(top_n, counts)[-1]
+            for index in compress(range(len(counter)), map(ge, counts, repeat(threshold))):
+                result.top.push(counts[index], (timestamps[index], counts[index], index))
+
+        result.first = timestamps[0]
+        result.last = timestamps[-1]
+        if period > 0:
+            def records(start: int, stop: int) -> list[tuple[int, int]]:
+                return list(zip(timestamps[start:stop], counts[start:stop]))
+
+            least_count, starts = CarCounter.least_window_starts(counts, counter.contiguity_ranges(), period)
+            result.least_count = least_count
+            result.least_periods = [tuple(records(start, start + period)) for start in starts]
+            result.head = records(0, period - 1)
+            result.tail.extend(records(max(len(counter) - period + 1, 0), len(counter)))
+            result._restart_window()
+        return result
+
+    def state(self) -> dict:
+        """
+        The aggregates of the counter, as a dict ready to be dumped as JSON (see from_state)
+
+        :return: a dict of lists and numbers
+        """
+        return {
+            "version": CHECKPOINT_VERSION,
+            "top_n": self.top_n,
+            "period": self.period,
+            "resolution": self._step,
+            "size": self.size,
+            "total": self.total,
+            "days": [[day, count] for day, count in self.days.items()],
+            "top": [list(item) for _, item in self.top.counted_items()],
+            "least_count": self.least_count,
+            "least_periods": [[list(record) for record in period] for period in self.least_periods],
+            "first": self.first,
+            "last": self.last,
+            "head": [list(record) for record in self.head],
+            "tail": [list(record) for record in self.tail],
+        }
+
+    @classmethod
+    def from_state(cls, state: dict) -> "StreamingCarCounter":
+        """
+        Build a counter from the aggregates given by state: records can then be added after the ones it received
+
+        :param state: a dict given by state
+        :return: a StreamingCarCounter
+        """
+        if state.get("version") != CHECKPOINT_VERSION:
+            raise ValueError(f"Unsupported state version {state.get('version')}, expected {CHECKPOINT_VERSION}")
+        result = cls(top_n=state["top_n"], period=state["period"],
+                     time_resolution=datetime.timedelta(seconds=state["resolution"]))
+        result.size = state["size"]
+        result.total = state["total"]
+        result.days = {day: count for day, count in state["days"]}
+        for timestamp, count, index in state["top"]:
+            result.top.push(count, (timestamp, count, index))
+        result.least_count = state["least_count"]
+        result.least_periods = [tuple(map(tuple, period)) for period in state["least_periods"]]
+        result.first = state["first"]
+        result.last = state["last"]
+        result.head = list(map(tuple, state["head"]))
+        result.tail.extend(map(tuple, state["tail"]))
+        result._restart_window()
+        return result
+
+    def add(self, timestamp: int, count: int):
+        """
+        Add a record to the counter
+
+        :param timestamp: timestamp in seconds since the epoch. Must not be before the previous one.
+        :param count: car count
+        """
+        if self.last is None:
+            self.first = timestamp
+        else:
+            if timestamp < self.last:
+                raise ValueError(f"Records must be given in time order: {from_seconds(timestamp)} "
+                                 f"after {from_seconds(self.last)}")
+            if timestamp - self.last > self._step:
+                self._window.clear()
+                self._window_count = 0
+        self.last = timestamp
+
+        self.total += count
+        day = timestamp // SECONDS_PER_DAY
+        self.days[day] = self.days.get(day, 0) + count
+        self.top.push(count, (timestamp, count, self.size))
+        self.size += 1
+
+        if self.period > 0:
+            if len(self.head) < self.period - 1:
+                self.head.append((timestamp, count))
+            if len(self._window) == self.period:
+                self._window_count -= self._window[0][1]
+            self._window.append((timestamp, count))
+            self._window_count += count
+            if len(self._window) == self.period:
+                self._offer_period(tuple(self._window), self._window_count)
+            # Appended after the window: the window needs the tail before it gets updated
+            self.tail.append((timestamp, count))
+
+    def _offer_period(self, period: tuple[tuple[int, int], ...], count: int):
+        """ Keep a period if it is (one of) the least ones found so far """
+        if not self.least_periods or count < self.least_count:
+            self.least_count = count
+            self.least_periods = [period]
+        elif count == self.least_count:
+            self.least_periods.append(period)
+
+    def merge(self, other: "StreamingCarCounter"):
+        """
+        Merge the aggregates of another counter, which received the records following the ones of this counter.
+        The result is the same as if this counter had received all the records of the other one:
+        merging partial counters is associative, and the periods spanning both counters are taken into account
+        thanks to their head and tail records.
+
+        :param other: a StreamingCarCounter with the same top_n and period, whose records are not before this one's
+        """
+        if (other.top_n, other.period, other.time_resolution) != (self.top_n, self.period, self.time_resolution):
+            raise ValueError(f"Cannot merge a counter tracking top {other.top_n} and periods of {other.period} "
+                             f"({other.time_resolution}) in one tracking top {self.top_n} and periods of "
+                             f"{self.period} ({self.time_resolution})")
+        if other.size == 0:
+            return
+        if self.last is not None and other.first < self.last:
+            raise ValueError(f"Records must be given in time order: {from_seconds(other.first)} "
+                             f"after {from_seconds(self.last)}")
+
+        self.total += other.total
+        for day, count in other.days.items():
+            self.days[day] = self.days.get(day, 0) + count
+        for count, (timestamp, _, index) in other.top.counted_items():
+            self.top.push(count, (timestamp, count, index + self.size))
+
+        if self.period > 0:
+            # Periods starting in our tail and ending in the other's head, made of contiguous records
+            boundary = list(self.tail) + other.head
+            for start in range(len(self.tail)):
+                period = tuple(boundary[start:start + self.period])
+                if len(period) == self.period and self._is_contiguous(period):
+                    self._offer_period(period, sum(count for _, count in period))
+            # Periods of the other counter, which all come after ours
+            if other.least_periods:
+                if not self.least_periods or other.least_count < self.least_count:
+                    self.least_count = other.least_count
+                    self.least_periods = list(other.least_periods)
+                elif other.least_count == self.least_count:
+                    self.least_periods += other.least_periods
+
+            self.head = (self.head + other.head)[:self.period - 1]
+            self.tail.extend(other.tail)
+            self._restart_window()
+
+        if self.first is None:
+            self.first = other.first
+        self.last = other.last
+        self.size += other.size
+
+    def _restart_window(self):
+        """ Restart the window of the current contiguous run from the last contiguous records of the tail """
+        self._window.clear()
+        for record in reversed(self.tail):
+            if self._window and self._window[0][0] - record[0] > self._step:
+                break
+            self._window.appendleft(record)
+        self._window_count = sum(count for _, count in self._window)
+
+    def _is_contiguous(self, records: tuple[tuple[int, int], ...]) -> bool:
+        return all(b[0] - a[0] <= self._step for a, b in zip(records, records[1:]))
+
+    def add_record(self, record: Record):
+        """
+        Add a record to the counter
+
+        :param record: a Record, which must not be before the previous one
+        """
+        self.add(record.seconds, record.car_count)
+
+    def consume(self, records: Iterable[Record]):
+        """
+        Add all the records of an iterable, in order
+
+        :param records: an iterable of Records, sorted by timestamp
+        """
+        for record in records:
+            self.add_record(record)
+
+    @profiled("stream", records=lambda args, _: args[0].size)
+    def consume_chunks(self, chunks: Iterable[bytes]):
+        """
+        Parse and add records from chunks of text (one record 'YYYY-MM-DDThh:mm:ss n' per line), in order.
+        Only one chunk is kept in memory at a time.
+
+        :param chunks: an iterable of chunks of bytes
+        """
+        add = self.add
+        for timestamp, count in parse_records(chunks):
+            add(timestamp, count)
+
+    @profiled("stream", records=lambda args, _: args[0].size)
+    def consume_files(self, paths: Iterable):
+        """
+        Add the records of several files, each one sorted by timestamp, in time order:
+        the files are read together, one chunk at a time, and their records merged with a k-way merge.
+
+        :param paths: paths to the files. Records with the same timestamp are taken in the order of the files.
+        """
+        files = [open_input(path) for path in paths]
+        try:
+            add = self.add
+            for timestamp, count in merge(*(parse_records(read_chunks(file)) for file in files), key=itemgetter(0)):
+                add(timestamp, count)
+        finally:
+            for file in files:
+                file.close()
+
+    def get_total_count(self) -> int:
+        """
+        Return how many cars have been counted in total
+        :return: Total number of cars
+        """
+        return self.total
+
+    def get_count_by_date(self) -> list[tuple[str, int]]:
+        """
+        Count the number of car per day (represented as a string yyyy-mm-dd)
+        :return: a list of tuples (date as a string, count)
+        """
+        return [(day_to_string(day), count) for day, count in sorted(self.days.items())]
+
+    def get_top_n(self, n: int = None) -> list[Record]:
+        """
+        Get the top n records with the top number of cars, including ties (see CarCounter.get_top_n).
+        :param n: must not be larger than the top_n given at construction (default)
+        :return: a list of records, ordered by record's timestamp
+        """
+        n = self.top_n if n is None else n
+        if self.size <= n:
+            # Every record is selected: keep them in their order, as CarCounter does
+            selected = sorted(self.top.items(n), key=itemgetter(2))
+        else:
+            selected = sorted(self.top.items(n), key=lambda item: (item[0], -item[1]))
+        return list(_to_records(selected))
+
+    def get_least_period(self, n: int = None) -> list[list[Record]]:
+        """
+        Contiguous periods of n records with the least amount of cars, including ties
+        (see CarCounter.get_least_period).
+        :param n: must be the period given at construction (default)
+        :return: a list of list, where each inner list represent a period
+        """
+        if n is not None and n != self.period:
+            raise ValueError(f"This counter tracks periods of {self.period} records, {n} asked")
+        return [list(_to_records(period)) for period in self.least_periods]
+
+
+def load_checkpoint(path) -> tuple[StreamingCarCounter, int, bytes, bytes]:
+    """
+    Load a checkpoint written by save_checkpoint
+
+    :param path: path to the checkpoint file
+    :return: a tuple (counter, offset in the input of the next record, first and last bytes of the input before it)
+    """
+    with open(path) as file:
+        checkpoint = json.load(file)
+    return (StreamingCarCounter.from_state(checkpoint["counter"]), checkpoint["offset"],
+            bytes.fromhex(checkpoint["first"]), bytes.fromhex(checkpoint["last"]))
+
+
+def save_checkpoint(path, state: dict, offset: int, first: bytes, last: bytes):
+    """
+    Save a checkpoint as JSON. The file is written aside and then renamed, so a reader never sees a partial file.
+
+    :param path: path to the checkpoint file
+    :param state: the state of the counter (see StreamingCarCounter.state)
+    :param offset: offset in the input of the next record
+    :param first: the first bytes of the input, to check that it is the same input next time
+    :param last: the last bytes of the input before the offset, to check that it was only appended to
+    """
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, "w") as file:
+        json.dump({"offset": offset, "first": first.hex(), "last": last.hex(), "counter": state}, file)
+    os.replace(temporary, path)
+
+
+@profiled("checkpoint", records=lambda args, counter: counter.size)
+def update_checkpoint(path, top_n: int = 3, period: int = 3, checkpoint_path=None) -> StreamingCarCounter:
+    """
+    Answer the questions for a growing input, only parsing the records appended since the previous call.
+    The aggregates of the records (see StreamingCarCounter.state) are saved in a checkpoint file
+    with the offset of the next record, and the next call starts from them. The answers are the same
+    as processing the whole input again.
+
+    The input is read from the start when there is no (valid) checkpoint, when it was made with another top_n,
+    period or time resolution, or when the first bytes of the input or the bytes before the offset changed
+    (e.g. a rotated log). Changes in the middle of the input are not detected: it must only be appended to.
+    A last line without an end of line may still be being written: it is never checkpointed, but parsed again
+    by the next call, and it is left out of the answers if it is not a valid record (yet).
+    Failing to write the checkpoint is not an error.
+
+    :param path: path to the input file, whose records must be sorted by timestamp
+    :param top_n: the largest n for which get_top_n can be asked
+    :param period: the n for which get_least_period can be asked
+    :param checkpoint_path: path to the checkpoint file. Default to the path of the input followed by '.checkpoint'
+    :return: a StreamingCarCounter with the aggregates of all the records of the input
+    """
+    checkpoint_path = str(path) + CHECKPOINT_SUFFIX if checkpoint_path is None else checkpoint_path
+    size = CHECKPOINT_FINGERPRINT_SIZE
+    try:
+        counter, offset, first, last = load_checkpoint(checkpoint_path)
+        if (counter.top_n, counter.period, counter.time_resolution) != \
+                (top_n, period, StreamingCarCounter.time_resolution):
+            raise ValueError("Checkpoint made for other questions")
+    except (OSError, ValueError, KeyError, TypeError):
+        counter, offset, first, last = StreamingCarCounter(top_n=top_n, period=period), 0, b"", b""
+
+    with open_input(path) as file:
+        if offset > 0:
+            same = file.read(len(first)) == first
+            file.seek(offset - len(last))
+            if not same or file.read(len(last)) != last:
+                # Not the input the checkpoint was made from
+                counter, offset, first, last = StreamingCarCounter(top_n=top_n, period=period), 0, b"", b""
+            file.seek(offset)
+        parser = ColumnParser()
+        add = counter.add
+        for chunk in read_chunks(file):
+            parser.feed(chunk)
+            for timestamp, count in zip(parser.timestamps, parser.counts):
+                add(timestamp, count)
+            del parser.timestamps[:]
+            del parser.counts[:]
+            offset += len(chunk)
+            if len(first) < size:
+                first = (first + chunk)[:size]
+            # Up to the fingerprint size before the incomplete last line
+            last = (last + chunk)[-size - len(parser.pending):]
+
+    pending = len(parser.pending)
+    try:
+        save_checkpoint(checkpoint_path, counter.state(), offset - pending, first[:offset - pending],
+                        last[:len(last) - pending][-size:])
+    except OSError:
+        pass
+    try:
+        last_line = parser.close()
+    except (ValueError, IndexError):
+        # A line caught while being written: taken into account once complete
+        last_line = ()
+    for timestamp, count in zip(*last_line):
+        add(timestamp, count)
+    return counter
+
+
+def _to_records(items: Iterable[tuple[int, int, ...]]) -> Iterator[Record]:
+    return (Record.from_seconds(item[0], item[1]) for item in items)
+
+
+def parse_records(chunks: Iterable[bytes]) -> Iterator[tuple[int, int]]:
+    """
+    Parse chunks of text (one record 'YYYY-MM-DDThh:mm:ss n' per line), one chunk at a time
+
+    :param chunks: an iterable of chunks of bytes
+    :return: an iterator of (timestamp in seconds since the epoch, count), in the order of the text
+    """
+    parser = ColumnParser()
+    for chunk in chunks:
+        parser.feed(chunk)
+        yield from zip(parser.timestamps, parser.counts)
+        del parser.timestamps[:]
+        del parser.counts[:]
+    yield from zip(*parser.close())
@@ -0,0 +1,13 @@
+def assert_same_answers(scc, cc):
+    """
+    Check that a StreamingCarCounter gives the same answers as a CarCounter with the same records
+
+    :param scc: a StreamingCarCounter
+    :param cc: a CarCounter
+    """
+    assert (scc.size == len(cc))
+    assert (scc.get_total_count() == cc.get_total_count())
+    assert (scc.get_count_by_date() == cc.get_count_by_date())
+    for k in range(0, scc.top_n + 1):
+        assert (scc.get_top_n(k) == cc.get_top_n(k))
+    assert (scc.get_least_period() == cc.get_least_period(scc.period))
@@ -1,8 +1,10 @@
 import datetime
+import os
 import pytest
 
 from car_counter import Record as TS
 from car_counter import CarCounter as CC
+from car_counter import QUERY_CACHE_SIZE
 
 
 #
@@ -186,6 +188,22 @@ def test_CC_group_by_contiguity(record_oneday, record_onemonth, record_newyear):
     assert (list(map(CC.total_count, new_year)) == [100])
 
 
+def test_CC_group_ranges(record_onemonth, record_newyear, record_seek):
+    """
+    Lazy groups given as index ranges, also over views of the records
+    """
+    assert (list(CC.date_group_ranges([])) == [] and list(CC.contiguity_group_ranges([])) == [])
+    assert (list(CC.date_group_ranges(record_onemonth)) == [(0, 3), (3, 6)])
+    assert (list(CC.contiguity_group_ranges(record_onemonth)) == [(0, 3), (3, 5), (5, 6)])
+    assert (list(CC.date_group_ranges(record_newyear)) == [(0, 3), (3, 6)])
+    assert (list(CC.contiguity_group_ranges(record_newyear)) == [(0, 6)])
+    view = CC(record_seek).records_between()
+    by_date = CC.group_by_date(view)
+    assert (list(map(CC.total_count, by_date)) == [179, 81, 134, 4])
+    assert ([list(group) for group in by_date] == CC.group_by_date(record_seek))
+    assert ([list(group) for group in CC.group_by_contiguity(view)] == CC.group_by_contiguity(record_seek))
+
+
 def test_CC_get_least_period(record_oneday, record_onemonth, record_seek, record_newyear):
     """
     Find a period of time with the least amount of car
@@ -214,3 +232,306 @@ def test_CC_get_least_period(record_oneday, record_onemonth, record_seek, record
     assert (CC(record_newyear).get_least_period(2) == [
         [TS.from_string("2021-12-31T23:30:00 5"), TS.from_string("2022-01-01T00:00:00 5")]
     ])
+
+
+def test_CC_columns(record_onemonth):
+    """
+    The records are stored as sorted columns of seconds since the epoch and car counts
+    """
+    cc = CC(reversed(record_onemonth))
+    assert (len(cc) == 6)
+    assert (list(cc.counts) == [5, 15, 30, 5, 15, 30])
+    assert (cc.timestamps[0] == 1635742800)  # 2021-11-01T05:00:00
+    assert (list(cc.timestamps) == sorted(cc.timestamps))
+    # Records are rebuilt on demand
+    assert (cc.records == record_onemonth)
+
+
+def test_CC_from_columns(record_onemonth):
+    """
+    Build a car counter from its columns, without creating records
+    """
+    cc = CC(record_onemonth)
+    other = CC.from_columns(cc.timestamps, cc.counts)
+    assert (other.records == record_onemonth)
+    assert (other.get_count_by_date() == [("2021-11-01", 50), ("2021-12-01", 50)])
+    with pytest.raises(ValueError):
+        CC.from_columns([0, 1800], [5])
+
+
+def test_CC_window_sums():
+    """
+    Running sums of windows of n counts within a range
+    """
+    counts = [5, 15, 30, 5, 15, 30]
+    assert (list(CC.window_sums(counts, 0, 6, 3)) == [50, 50, 50, 50])
+    assert (list(CC.window_sums(counts, 1, 5, 2)) == [45, 35, 20])
+    assert (list(CC.window_sums(counts, 0, 6, 6)) == [100])
+    assert (list(CC.window_sums(counts, 0, 2, 3)) == [])
+    assert (CC.least_window_starts(counts, [(0, 3), (3, 6)], 2) == (20, [0, 3]))
+    assert (CC.least_window_starts(counts, [(0, 1)], 2) == (0, []))
+
+
+def test_CC_get_least_period_long_block():
+    """
+    A contiguous block much longer than the recursion limit, with the quietest period at the end
+    """
+    start = datetime.datetime(2021, 1, 1)
+    size = 20000
+    records = [TS(start + i * CC.time_resolution, 10) for i in range(size - 3)]
+    records += [TS(start + i * CC.time_resolution, 1) for i in range(size - 3, size)]
+    cc = CC(records)
+    assert (cc.get_least_period(3) == [records[-3:]])
+    assert (len(cc.get_least_period(48)) == 1)
+    assert (cc.get_least_period(48)[0] == records[-48:])
+
+
+def test_CC_get_bottom_n(record_oneday, record_seek):
+    """
+    Get the n half hours with least cars, with the same tie rules as get_top_n
+    """
+    assert (CC([]).get_bottom_n(1) == [])
+    assert (CC(record_oneday).get_bottom_n(0) == [])
+    assert (CC(record_oneday).get_bottom_n(1) == [record_oneday[0]])
+    assert (CC(record_oneday).get_bottom_n(2) == [record_oneday[0], record_oneday[1]])
+    assert (CC(record_oneday).get_bottom_n(4) == record_oneday)
+
+    # Ties on seek when n = 6 (last count at 9)
+    assert (CC(record_seek).get_bottom_n(6) == list(
+        map(TS.from_string, [
+            "2021-12-01T05:00:00 5",
+            "2021-12-01T15:00:00 9",
+            "2021-12-01T23:30:00 0",
+            "2021-12-05T11:30:00 7",
+            "2021-12-05T12:30:00 6",
+            "2021-12-05T13:30:00 9",
+            "2021-12-09T00:00:00 4",
+        ])))
+
+
+def test_CC_save_open(tmp_path, record_seek, record_newyear):
+    """
+    Save a counter in a binary file, and memory-map it back
+    """
+    for records in [record_seek, record_newyear, []]:
+        path = tmp_path / "counter.cache"
+        cc = CC(records)
+        cc.save(path)
+        opened = CC.open(path)
+        assert (opened.records == cc.records)
+        assert (opened.get_total_count() == cc.get_total_count())
+        assert (opened.get_count_by_date() == cc.get_count_by_date())
+        assert (opened.get_top_n(5) == cc.get_top_n(5))
+        assert (opened.get_least_period(3) == cc.get_least_period(3))
+    # Not a cache file
+    path = tmp_path / "text.cache"
+    path.write_text("2021-12-01T05:00:00 5\n" * 10)
+    with pytest.raises(ValueError):
+        CC.open(path)
+
+
+def test_CC_from_cached_file(tmp_path):
+    """
+    The cache is built next to the text file, used while it is up to date, and rebuilt otherwise
+    """
+    path = tmp_path / "records.txt"
+    path.write_text("2021-12-01T05:00:00 5\n2021-12-01T05:30:00 15\n")
+    assert (CC.from_cached_file(path).get_total_count() == 20)
+    cache = tmp_path / "records.txt.cache"
+    assert (cache.exists())
+    assert (isinstance(CC.from_cached_file(path).timestamps, memoryview))  # Memory-mapped
+    # A newer text file rebuilds the cache
+    path.write_text("2021-12-01T05:00:00 5\n2021-12-01T05:30:00 15\n2021-12-01T06:00:00 30\n")
+    os.utime(path, ns=(cache.stat().st_mtime_ns + 10 ** 9,) * 2)
+    assert (CC.from_cached_file(path).get_total_count() == 50)
+    assert (CC.open(cache).get_total_count() == 50)
+    # A text file replaced by an older one (e.g. 'cp -p') rebuilds the cache too
+    path.write_text("2021-12-01T05:00:00 5\n")
+    os.utime(path, ns=(cache.stat().st_mtime_ns - 10 ** 9,) * 2)
+    assert (CC.from_cached_file(path).get_total_count() == 5)
+    assert (CC.open(cache).get_total_count() == 5)
+    with pytest.raises(ValueError):
+        CC.open(cache, (path.stat().st_size + 1, path.stat().st_mtime_ns))
+
+
+def test_CC_range_queries(record_seek):
+    """
+    Count and select the records within a time range
+    """
+    cc = CC(record_seek)
+    dt = datetime.datetime.fromisoformat
+    assert (cc.count_between() == 398)
+    assert (cc.count_between(dt("2021-12-05"), dt("2021-12-06")) == 81)
+    assert (cc.count_between(dt("2021-12-01T07:30:00"), dt("2021-12-01T15:00:00")) == 46 + 42)
+    assert (cc.count_between(dt("2021-12-09")) == 4)
+    assert (cc.count_between(end=dt("2021-12-01T05:30:00")) == 5)
+    assert (cc.count_between(dt("2021-12-06"), dt("2021-12-02")) == 0)
+    assert (cc.count_between(dt("2022-01-01")) == 0)
+
+    # Records in a range, as a view
+    view = cc.records_between(dt("2021-12-05"), dt("2021-12-06"))
+    assert (len(view) == 7)
+    assert (list(view) == record_seek[10:17])
+    assert (view[0] == record_seek[10] and view[-1] == record_seek[16])
+    assert (list(view[2:4]) == record_seek[12:14])
+    with pytest.raises(IndexError):
+        view[7]
+
+    # Range restricted queries
+    assert (cc.get_top_n(1, dt("2021-12-05"), dt("2021-12-06")) == [TS.from_string("2021-12-05T09:30:00 18")])
+    assert (cc.get_bottom_n(1, start=dt("2021-12-08")) == [TS.from_string("2021-12-09T00:00:00 4")])
+    assert (cc.get_least_period(2, dt("2021-12-01T07:00:00"), dt("2021-12-02")) == [
+        [TS.from_string("2021-12-01T15:00:00 9"), TS.from_string("2021-12-01T15:30:00 11")]
+    ])
+    assert (cc.get_least_period(2, start=dt("2021-12-08")) == [])
+    assert (cc.between(dt("2021-12-05"), dt("2021-12-09")).get_count_by_date() == [
+        ("2021-12-05", 81), ("2021-12-08", 134)
+    ])
+
+
+def test_CC_add_records(record_onemonth, record_newyear):
+    """
+    Add records to an existing counter, keeping the order and the aggregates up to date
+    """
+    cc = CC(record_onemonth[3:])
+    assert (cc.get_total_count() == 50)
+    assert (cc.get_count_by_date() == [("2021-12-01", 50)])
+    assert (len(list(cc.contiguity_ranges())) == 2)
+    # Newer records are appended in place
+    timestamps = cc.timestamps
+    cc.add_records(reversed(record_newyear))
+    assert (cc.timestamps is timestamps)
+    assert (cc.records == record_onemonth[3:] + record_newyear)
+    assert (cc.get_total_count() == 150)
+    assert (cc.get_count_by_date() == [("2021-12-01", 50), ("2021-12-31", 50), ("2022-01-01", 50)])
+    assert (list(cc.contiguity_ranges()) == [(0, 2), (2, 3), (3, 9)])
+    # Older records are merged
+    cc.add_records(record_onemonth[:3])
+    assert (cc.records == record_onemonth + record_newyear)
+    assert (cc.get_total_count() == 200)
+    assert (cc.get_count_by_date()[0] == ("2021-11-01", 50))
+    assert (cc.get_least_period(3) == [record_newyear[1:4], record_newyear[2:5]])
+    # Views are not affected
+    view = cc.records_between()
+    cc.add_records([TS.from_string("2022-02-01T00:00:00 1")])
+    assert (len(view) == 12 and len(cc) == 13)
+
+
+def test_CC_add_records_duplicates(record_oneday):
+    """
+    Policies for the records sharing a timestamp with another one
+    """
+    def added(policy, *strings):
+        cc = CC(record_oneday)
+        cc.get_count_by_date()
+        cc.add_records(map(TS.from_string, strings), duplicates=policy)
+        assert (cc.get_count_by_date() == [("2021-12-01", cc.get_total_count())])
+        return [str(rec) for rec in cc.records]
+
+    new = ("2021-12-01T05:30:00 1", "2021-12-01T05:30:00 2")
+    assert (added("keep", *new) == [
+        "2021-12-01T05:00:00 5", "2021-12-01T05:30:00 15", "2021-12-01T05:30:00 1", "2021-12-01T05:30:00 2",
+        "2021-12-01T06:00:00 30"])
+    assert (added("replace", *new) == ["2021-12-01T05:00:00 5", "2021-12-01T05:30:00 2", "2021-12-01T06:00:00 30"])
+    assert (added("ignore", *new) == ["2021-12-01T05:00:00 5", "2021-12-01T05:30:00 15", "2021-12-01T06:00:00 30"])
+    assert (added("sum", *new) == ["2021-12-01T05:00:00 5", "2021-12-01T05:30:00 18", "2021-12-01T06:00:00 30"])
+    assert (added("sum", "2021-12-01T06:00:00 1", "2021-12-01T06:30:00 1")[-2:] == [
+        "2021-12-01T06:00:00 31", "2021-12-01T06:30:00 1"])
+    with pytest.raises(ValueError):
+        added("error", "2021-12-01T05:30:00 1")
+    with pytest.raises(ValueError):
+        added("error", "2021-12-02T05:30:00 1", "2021-12-02T05:30:00 1")
+    with pytest.raises(ValueError):
+        added("unknown", "2021-12-02T05:30:00 1")
+    assert (added("error", "2021-12-01T04:30:00 1")[0] == "2021-12-01T04:30:00 1")
+
+
+def test_CC_time_resolution(record_onemonth):
+    """
+    The time resolution can be set per counter, and is used to find contiguous records
+    """
+    hour = datetime.timedelta(hours=1)
+    assert (len(CC.group_by_contiguity(record_onemonth)) == 3)
+    assert (len(CC.group_by_contiguity(record_onemonth, hour)) == 3)
+    assert (len(CC.group_by_contiguity(record_onemonth, datetime.timedelta(hours=2))) == 2)
+    cc = CC(record_onemonth, time_resolution=datetime.timedelta(hours=2))
+    assert (CC.time_resolution == datetime.timedelta(minutes=30))
+    assert (list(cc.contiguity_ranges()) == [(0, 3), (3, 6)])
+    assert (cc.get_least_period(3) == [record_onemonth[0:3], record_onemonth[3:6]])
+    assert (CC(record_onemonth).get_least_period(3) == [record_onemonth[0:3]])
+    # Kept by views and cache files
+    assert (cc.between().time_resolution == datetime.timedelta(hours=2))
+
+
+def test_CC_rollups(record_seek, record_newyear):
+    """
+    Pre-aggregated counts per hour, day, week and month
+    """
+    cc = CC(record_seek)
+    assert (cc.get_count_by_period("day") == cc.get_count_by_date())
+    assert (cc.get_count_by_period("hour")[:3] == [
+        ("2021-12-01T05:00:00", 17), ("2021-12-01T06:00:00", 29), ("2021-12-01T07:00:00", 71)
+    ])
+    # 2021-12-01 is a Wednesday
+    assert (cc.get_count_by_period("week") == [("2021-11-29", 179 + 81), ("2021-12-06", 134 + 4)])
+    assert (cc.get_count_by_period("month") == [("2021-12", 398)])
+    assert (cc.get_total_count() == 398)
+    assert (cc.get_top_periods(1, "hour") == [("2021-12-01T07:00:00", 71)])
+    assert (cc.get_top_periods(2, "day") == [("2021-12-01", 179), ("2021-12-08", 134)])
+    new_year = CC(record_newyear)
+    assert (new_year.get_count_by_period("month") == [("2021-12", 50), ("2022-01", 50)])
+    assert (new_year.get_count_by_period("week") == [("2021-12-27", 100)])
+    with pytest.raises(ValueError):
+        cc.rollup("year")
+    # Rollups follow the added records
+    new_year.add_records([TS.from_string("2022-02-01T00:00:00 1")])
+    assert (new_year.get_count_by_period("month")[-1] == ("2022-02", 1))
+
+
+def test_CC_from_runs(record_seek):
+    """
+    Sorted runs concatenated when they do not overlap, merged otherwise, keeping the order of the runs for ties
+    """
+    cc = CC(record_seek)
+    ts, counts = cc.timestamps, cc.counts
+    assert (CC.from_runs([]).records == [])
+    assert (CC.from_runs([(ts[10:], counts[10:]), (ts[:0], counts[:0]), (ts[:10], counts[:10])]).records == cc.records)
+    assert (CC.from_runs([(ts[::2], counts[::2]), (ts[1::2], counts[1::2])]).records == cc.records)
+    # Same timestamp at the end of a run and the start of another one
+    runs = [([1800, 3600], [2, 3]), ([0, 1800], [0, 1])]
+    assert (list(CC.from_runs(runs).counts) == [0, 2, 1, 3])
+    assert (list(CC.from_runs(runs[::-1]).counts) == [0, 1, 2, 3])
+    with pytest.raises(ValueError):
+        CC.from_runs([([0, 1800], [1])])
+
+
+def test_CC_memoized_queries(record_seek, record_onemonth):
+    """
+    Answers memoized until records are added, and answers for several n at once
+    """
+    cc = CC(record_seek)
+    reference = CC(record_seek)
+    ns = [0, 1, 3, 5, 10, 24, 30]
+    tops = cc.get_top_ns(ns)
+    assert (tops == {n: reference.get_top_n(n) for n in ns})
+    assert ({n: cc.get_bottom_n(n) for n in ns} == {n: reference.get_bottom_n(n) for n in ns})
+    assert (cc.get_least_periods(ns) == {n: reference.get_least_period(n) for n in ns})
+    # Answers are copies
+    cc.get_top_n(3).clear()
+    cc.get_least_period(3)[0].clear()
+    cc.get_count_by_date().clear()
+    assert (cc.get_top_n(3) == reference.get_top_n(3))
+    assert (cc.get_least_period(3) == reference.get_least_period(3))
+    assert (cc.get_count_by_date() == reference.get_count_by_date())
+    # Adding records drops the answers
+    for added in [[TS.from_string("2021-12-31T00:00:00 100"), TS.from_string("2021-12-31T00:30:00 0")],
+                  record_onemonth]:
+        cc.add_records(added)
+        reference = CC(reference.records + added)
+        assert (len(cc._queries) == 0)
+        assert (cc.get_top_ns(ns) == {n: reference.get_top_n(n) for n in ns})
+        assert (cc.get_least_periods(ns) == {n: reference.get_least_period(n) for n in ns})
+        assert (cc.get_count_by_date() == reference.get_count_by_date())
+    # Bounded cache
+    cc.get_top_ns(range(QUERY_CACHE_SIZE + 10))
+    assert (len(cc._queries) == QUERY_CACHE_SIZE)
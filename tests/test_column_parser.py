@@ -0,0 +1,51 @@
+import pytest
+
+from car_counter import ColumnParser as CP
+from car_counter import CarCounter as CC
+from car_counter import Record as REC
+from car_counter import to_seconds
+
+
+def test_ColumnParser_parse_chunks():
+    """
+    Must parse lines into columns, whatever the chunk boundaries
+    """
+    text = b"2021-12-01T05:00:00 5\n2021-12-01T05:30:00 12\n2021-12-02T05:30:00 14\n"
+    expected_ts = [to_seconds(REC.parse_string(line)[0]) for line in text.decode().splitlines()]
+    for size in [1, 2, 7, 21, 22, len(text), 1 << 20]:
+        chunks = [text[i:i + size] for i in range(0, len(text), size)]
+        timestamps, counts = CP.parse_chunks(chunks)
+        assert (list(timestamps) == expected_ts)
+        assert (list(counts) == [5, 12, 14])
+    # Last line without end of line, and windows end of lines
+    timestamps, counts = CP.parse_chunks([b"2021-12-01T05:00:00 5\r\n2021-12-01T05:30:00 12"])
+    assert (list(counts) == [5, 12])
+
+
+def test_ColumnParser_fallback():
+    """
+    Lines not following the fixed-width layout go through Record.parse_string
+    """
+    timestamps, counts = CP.parse_chunks([b"2021-12-01T05:00:00.5 5\n2021-12-01T05:30 12\n"])
+    assert (list(counts) == [5, 12])
+    assert (timestamps[1] - timestamps[0] == 1800)
+    with pytest.raises(ValueError):
+        CP.parse_chunks([b"2021-12-01T05:00:00 5.5\n"])
+    with pytest.raises(ValueError):
+        CP.parse_chunks([b"2021-13-01T05:00:00 5\n"])
+    with pytest.raises(ValueError):
+        CP.parse_chunks([b"2021-12-01T25:00:00 5\n"])
+
+
+def test_CC_from_file(tmp_path):
+    """
+    Load a file into a car counter, sorting it if needed
+    """
+    seek = CC.from_file("tests/fixtures/record_seek.txt")
+    assert (seek.get_total_count() == 398)
+    assert (len(seek) == 24)
+    path = tmp_path / "unsorted.txt"
+    path.write_text("2021-12-01T06:00:00 30\n2021-12-01T05:00:00 5\n2021-12-01T05:30:00 15\n")
+    assert (CC.from_file(path).records == list(map(REC.from_string, [
+        "2021-12-01T05:00:00 5", "2021-12-01T05:30:00 15", "2021-12-01T06:00:00 30"
+    ])))
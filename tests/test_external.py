@@ -0,0 +1,63 @@
+import gzip
+
+import pytest
+
+from car_counter import CarCounter as CC
+from conftest import assert_same_answers
+from external import parse_runs, read_files, sort_chunks, sort_counter
+
+SEEK = "tests/fixtures/record_seek.txt"
+
+
+@pytest.fixture
+def shuffled():
+    """
+    Lines of the seek fixture in another order, with records sharing timestamps
+    :return: the text
+    """
+    lines = open(SEEK, "rb").read().splitlines()
+    lines = lines[7::3] + lines[::3] + lines[1:7:3] + lines[2::3] + [lines[4][:20] + b"17", lines[0][:20] + b"2"]
+    return b"\n".join(lines) + b"\n"
+
+
+def test_parse_runs(shuffled):
+    """
+    Text parsed by runs of records
+    """
+    runs = list(parse_runs([shuffled[i:i + 50] for i in range(0, len(shuffled), 50)], 5))
+    assert (all(len(timestamps) >= 5 for timestamps, _ in runs[:-1]))
+    assert (sum(len(timestamps) for timestamps, _ in runs) == 26)
+    assert (list(parse_runs([], 5)) == [])
+
+
+def test_sort_chunks(tmp_path, shuffled):
+    """
+    Records sorted by runs spilled to temporary files, then merged: as a stable sort in memory
+    """
+    (tmp_path / "records.txt").write_bytes(shuffled)
+    expected = CC.from_file(tmp_path / "records.txt")
+    spill = tmp_path / "spill"
+    spill.mkdir()
+    chunks = [shuffled[i:i + 30] for i in range(0, len(shuffled), 30)]
+    for run_size in [1, 2, 3, 7, 100]:
+        assert (list(sort_chunks(chunks, run_size, spill)) == list(zip(expected.timestamps, expected.counts)))
+        assert (list(spill.iterdir()) == [])  # Temporary files removed
+    # Sorted input: the runs are read one after the other
+    cc = CC.from_file(SEEK)
+    assert (list(sort_chunks([open(SEEK, "rb").read()], 4)) == list(zip(cc.timestamps, cc.counts)))
+    assert (list(sort_chunks([], 4)) == [])
+
+
+def test_sort_counter(tmp_path, shuffled):
+    """
+    Answers of the sorted stream, from one or several files, compressed or not
+    """
+    (tmp_path / "records.txt").write_bytes(shuffled)
+    cc = CC.from_file(tmp_path / "records.txt")
+    middle = shuffled.index(b"\n", 200)
+    (tmp_path / "a.txt").write_bytes(shuffled[:middle])  # No final end of line
+    (tmp_path / "b.gz").write_bytes(gzip.compress(shuffled[middle + 1:]))
+    for run_size in [1, 5, 1000]:
+        for period in [0, 1, 3]:
+            scc = sort_counter(read_files([tmp_path / "a.txt", tmp_path / "b.gz"]), 3, period, run_size, tmp_path)
+            assert_same_answers(scc, cc)
@@ -0,0 +1,68 @@
+import shutil
+
+import pytest
+
+from car_counter import CarCounter as CC
+from car_counter import Record as TS
+from fleet import CarCounterFleet as Fleet
+
+SEEK = "tests/fixtures/record_seek.txt"
+
+
+def test_Fleet_from_directory(tmp_path):
+    """
+    One file per sensor, in a shared layout
+    """
+    shutil.copy(SEEK, tmp_path / "north.txt")
+    (tmp_path / "south.txt").write_text("2021-12-01T07:30:00 4\n2021-12-01T05:00:00 1\n2021-12-01T05:30:00 2\n")
+    fleet = Fleet.from_directory(tmp_path)
+    assert (fleet.sensors == ["north", "south"])
+    assert (list(fleet.offsets) == [0, 24, 27])
+    seek = CC.from_file(SEEK)
+    assert (fleet.counter("north").records == seek.records)
+    assert (fleet.counter("south").get_count_by_date() == [("2021-12-01", 7)])
+    assert (Fleet.from_directory(tmp_path, workers=2).counts == fleet.counts)
+    # Cache and checkpoint files are not sensors
+    CC.from_cached_file(tmp_path / "north.txt")
+    (tmp_path / "south.txt.checkpoint").write_text("{}")
+    assert (Fleet.from_directory(tmp_path).sensors == ["north", "south"])
+    # Two files for the same sensor
+    (tmp_path / "south.csv").write_text("2021-12-01T07:30:00 4\n")
+    with pytest.raises(ValueError):
+        Fleet.from_directory(tmp_path)
+
+
+def test_Fleet_from_file(tmp_path):
+    """
+    One file with a sensor id column
+    """
+    path = tmp_path / "fleet.txt"
+    path.write_text("b 2021-12-01T05:30:00 2\na 2021-12-01T05:00:00 5\nb 2021-12-01T05:00:00 1\n\n")
+    fleet = Fleet.from_file(path)
+    assert (fleet.sensors == ["a", "b"])
+    assert (fleet.counter("b").records == [TS.from_string("2021-12-01T05:00:00 1"),
+                                           TS.from_string("2021-12-01T05:30:00 2")])
+
+
+def test_Fleet_queries(tmp_path):
+    """
+    Batched answers for every sensor, sequential or in a pool of processes, and fleet-wide rollups
+    """
+    seek = CC.from_file(SEEK)
+    other = CC.from_columns(seek.timestamps[:6], [1, 2, 3, 4, 5, 6])
+    fleet = Fleet({"seek": seek, "other": other})
+    assert (fleet.get_total_counts() == {"seek": 398, "other": 21})
+    assert (fleet.get_total_count() == 419)
+    for workers in [1, 2]:
+        assert (fleet.get_counts_by_date(workers) == {"seek": seek.get_count_by_date(),
+                                                      "other": other.get_count_by_date()})
+        assert (fleet.get_top_n(3, workers) == {"seek": seek.get_top_n(3), "other": other.get_top_n(3)})
+        assert (fleet.get_least_period(3, workers) == {"seek": seek.get_least_period(3),
+                                                       "other": other.get_least_period(3)})
+        assert (fleet.answer(3, 2, workers) == {
+            name: (counter.get_count_by_date(), counter.get_top_n(3), counter.get_least_period(2))
+            for name, counter in [("seek", seek), ("other", other)]})
+    # Busiest half hours over all the sensors: the counts of a same timestamp are added
+    assert (fleet.get_busiest_periods(1) == [TS.from_string("2021-12-01T07:30:00 52")])
+    assert (fleet.combined().get_total_count() == 419)
+    assert (Fleet().get_total_counts() == {})
@@ -0,0 +1,48 @@
+import datetime
+
+import pytest
+
+from benchmarks.bench import regressions
+from benchmarks.generator import DISTRIBUTIONS, generate_columns, generate_records
+from car_counter import CarCounter as CC
+
+
+def test_generate_columns():
+    """
+    Sorted records, the same for a seed
+    """
+    for distribution in DISTRIBUTIONS:
+        timestamps, counts = generate_columns(1000, distribution=distribution, max_count=50, seed=1)
+        assert (len(timestamps) == len(counts) == 1000)
+        assert (all(a < b for a, b in zip(timestamps, timestamps[1:])))
+        assert (all(0 <= count <= 50 for count in counts))
+        assert ((timestamps, counts) == generate_columns(1000, distribution=distribution, max_count=50, seed=1))
+    assert (generate_columns(1000, seed=1) != generate_columns(1000, seed=2))
+    with pytest.raises(ValueError):
+        generate_columns(10, distribution="unknown")
+
+
+def test_generate_gaps():
+    """
+    Gaps split the records in contiguous blocks
+    """
+    resolution = datetime.timedelta(minutes=5)
+    timestamps, counts = generate_columns(500, resolution=resolution, gap_density=0)
+    assert (len(list(CC.from_sorted_columns(timestamps, counts, resolution).contiguity_ranges())) == 1)
+    timestamps, counts = generate_columns(500, resolution=resolution, gap_density=0.1)
+    assert (len(list(CC.from_sorted_columns(timestamps, counts, resolution).contiguity_ranges())) > 1)
+    records = generate_records(10, gap_density=0)
+    assert (records == CC.from_sorted_columns(*generate_columns(10, gap_density=0)).records)
+
+
+def test_regressions():
+    """
+    Stages slower or bigger than the baseline times the threshold, ignoring small differences
+    """
+    baseline = {"10": {"parse": {"seconds": 1.0, "peak_bytes": 10 ** 6},
+                       "top_n": {"seconds": 0.001, "peak_bytes": 1000}}}
+    assert (regressions(baseline, baseline, 1.5, 0.005) == [])
+    results = {"10": {"parse": {"seconds": 2.0, "peak_bytes": 10 ** 7},
+                      "top_n": {"seconds": 0.003, "peak_bytes": 2000},
+                      "new": {"seconds": 9.0, "peak_bytes": 10 ** 9}}}
+    assert (len(regressions(results, baseline, 1.5, 0.005)) == 2)
@@ -0,0 +1,143 @@
+import bz2
+import gzip
+import lzma
+
+import pytest
+
+from car_counter import CarCounter as CC
+from car_counter import compression_of
+from conftest import assert_same_answers
+from parallel import expand_paths, load_files, load_gzip, process_file, process_gzip_range, process_shard, split_file
+from parallel import split_gzip
+from streaming import StreamingCarCounter as SCC
+
+SEEK = "tests/fixtures/record_seek.txt"
+
+
+def test_split_file():
+    """
+    Split a file in byte ranges starting on lines
+    """
+    data = open(SEEK, "rb").read()
+    for shards in [1, 2, 3, 5, 24, 100]:
+        ranges = split_file(SEEK, shards)
+        assert (len(ranges) <= shards)
+        assert (ranges[0][0] == 0 and ranges[-1][1] == len(data))
+        for (_, stop), (start, _) in zip(ranges, ranges[1:]):
+            assert (stop == start and data[start - 1:start] == b"\n")
+
+
+def test_SCC_from_counter():
+    """
+    Aggregates computed at once from a CarCounter
+    """
+    cc = CC.from_file(SEEK)
+    for period in range(0, 5):
+        assert_same_answers(SCC.from_counter(cc, top_n=5, period=period), cc)
+    assert_same_answers(SCC.from_counter(CC(), top_n=3, period=3), CC())
+
+
+def test_SCC_merge():
+    """
+    Merging the aggregates of consecutive shards gives the same answers as the whole file
+    """
+    cc = CC.from_file(SEEK)
+    for period in range(1, 5):
+        for shards in [2, 3, 7, 24]:
+            partials = [process_shard(SEEK, start, stop, 5, period) for start, stop in split_file(SEEK, shards)]
+            merged = partials[0]
+            for partial in partials[1:]:
+                merged.merge(partial)
+            assert_same_answers(merged, cc)
+    # Periods spanning several shards, some of them shorter than the period
+    cc = CC.from_columns(range(0, 1800 * 10, 1800), [5, 1, 1, 1, 1, 9, 0, 0, 0, 8])
+    for period in range(1, 8):
+        merged = SCC.from_counter(CC(), top_n=3, period=period)
+        for i in range(10):
+            merged.merge(SCC.from_counter(CC.from_columns(cc.timestamps[i:i + 1], cc.counts[i:i + 1]), 3, period))
+        assert_same_answers(merged, cc)
+    # Shards must be in time order
+    later = SCC.from_counter(CC.from_file(SEEK), 3, 3)
+    with pytest.raises(ValueError):
+        later.merge(SCC.from_counter(CC.from_columns([0], [1]), 3, 3))
+
+
+def test_process_file(tmp_path):
+    """
+    Process a file with a pool of processes
+    """
+    assert_same_answers(process_file(SEEK, 3), CC.from_file(SEEK))
+    # Unsorted within shards: still fine, as long as shards do not overlap
+    path = tmp_path / "records.txt"
+    path.write_text("2021-12-01T06:00:00 30\n2021-12-01T05:00:00 5\n2021-12-01T05:30:00 15\n")
+    assert_same_answers(process_file(path, 1), CC.from_file(path))
+    empty = tmp_path / "empty.txt"
+    empty.write_text("")
+    assert (process_file(empty, 2).get_total_count() == 0)
+
+
+def test_load_files(tmp_path):
+    """
+    Several files, given as paths, globs or directories, parsed and merged
+    """
+    lines = open(SEEK).read().splitlines()
+    (tmp_path / "a.txt").write_text("\n".join(lines[:10]))
+    (tmp_path / "b.txt").write_text("\n".join(reversed(lines[10:])))  # Sorted when parsed
+    (tmp_path / "b.txt.cache").write_bytes(b"")
+    (tmp_path / "sub").mkdir()
+    assert (expand_paths([str(tmp_path)]) == [str(tmp_path / "a.txt"), str(tmp_path / "b.txt")])
+    assert (expand_paths([str(tmp_path / "b*"), str(tmp_path / "*.txt")]) ==
+            [str(tmp_path / "b.txt"), str(tmp_path / "a.txt")])
+    assert (expand_paths(["missing.txt"]) == ["missing.txt"])
+    cc = CC.from_file(SEEK)
+    for workers in [1, 2, None]:
+        merged = load_files(expand_paths([str(tmp_path / "b.txt"), str(tmp_path / "a.txt")]), workers)
+        assert (merged.records == cc.records)
+    # Overlapping files
+    (tmp_path / "c.txt").write_text("\n".join(lines[::2]))
+    (tmp_path / "d.txt").write_text("\n".join(lines[1::2]))
+    assert (load_files([tmp_path / "c.txt", tmp_path / "d.txt"]).records == cc.records)
+
+
+def test_compressed_files(tmp_path):
+    """
+    gzip, bzip2 and xz files, detected by their first bytes
+    """
+    data = open(SEEK, "rb").read()
+    cc = CC.from_file(SEEK)
+    assert (compression_of(SEEK) is None)
+    for name, compress in [("gzip", gzip.compress), ("bz2", bz2.compress), ("xz", lzma.compress)]:
+        path = tmp_path / "records"  # Whatever the extension
+        path.write_bytes(compress(data))
+        assert (compression_of(path) == name)
+        assert (CC.from_file(path).records == cc.records)
+        assert (load_files([path, SEEK]).records == CC.from_runs([(cc.timestamps, cc.counts)] * 2).records)
+        scc = SCC(top_n=3, period=3)
+        scc.consume_files([path])
+        assert_same_answers(scc, cc)
+
+
+def test_load_gzip(tmp_path):
+    """
+    Multi-member gzip files decompressed in parallel, members being split within lines
+    """
+    data = open(SEEK, "rb").read()
+    cc = CC.from_file(SEEK)
+    path = tmp_path / "records.gz"
+    for cuts in [[], [len(data) // 2], [5, 30, 31, 200, 201, len(data) - 1], list(range(0, len(data), 7))]:
+        bounds = [0] + cuts + [len(data)]
+        path.write_bytes(b"".join(gzip.compress(data[start:stop]) for start, stop in zip(bounds, bounds[1:])))
+        for workers in [1, 2, 3, 8]:
+            ranges = split_gzip(path, workers)
+            assert (len(ranges) <= max(workers, 1))
+            assert (ranges[0][0] == 0 and ranges[-1][1] == path.stat().st_size)
+            assert (load_gzip(path, workers).records == cc.records)
+    # A range that does not end on a member
+    path.write_bytes(gzip.compress(data))
+    assert (process_gzip_range(path, 0, path.stat().st_size - 1) is None)
+    assert (process_gzip_range(path, 0, path.stat().st_size)[0] == b"")
+    # Last line (without end of line) split between members, empty member, and empty file
+    path.write_bytes(gzip.compress(data[:-3]) + gzip.compress(data[-3:]) + gzip.compress(b""))
+    assert (load_gzip(path, 2).records == cc.records)
+    path.write_bytes(b"")
+    assert (len(load_gzip(path, 2)) == 0)
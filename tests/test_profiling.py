@@ -0,0 +1,71 @@
+import pytest
+
+from car_counter import CarCounter as CC
+from profiling import Profiler, profiled
+
+SEEK = "tests/fixtures/record_seek.txt"
+
+
+def test_profiler_phases():
+    """
+    Phases of a run, with their number of records, nested in the phases calling them
+    """
+    with Profiler() as profiler:
+        cc = CC.from_file(SEEK)
+        cc.get_total_count()
+        cc.get_count_by_date()
+        cc.get_top_n(3)
+        cc.get_least_period(3)
+    assert (Profiler.active is None)
+    phases = [(phase["name"], phase["depth"], phase["records"]) for phase in profiler.phases]
+    assert (phases == [("parse", 0, 24), ("sort", 0, 24), ("total_count", 0, 24), ("group_by_date", 0, 24),
+                       ("top_n", 0, 24), ("least_period", 0, 24), ("group_by_contiguity", 1, 24)])
+    assert (all(phase["seconds"] >= 0 for phase in profiler.phases))
+    assert (profiler.seconds >= sum(phase["seconds"] for phase in profiler.phases if phase["depth"] == 0))
+    assert (profiler.report()["phases"] == profiler.phases)
+
+
+def test_profiler_disabled():
+    """
+    Nothing is recorded out of a profiler
+    """
+    profiler = Profiler()
+    CC.from_file(SEEK).get_least_period(3)
+    assert (profiler.phases == [])
+
+
+def test_profiler_memory():
+    """
+    Peak memory of the phases, an enclosing phase reaching at least the peak of the phases it calls
+    """
+
+    @profiled("outer", records=lambda args, result: len(result))
+    def outer():
+        data = inner()
+        return data[:10]
+
+    @profiled("inner", records=lambda args, result: len(result))
+    def inner():
+        return list(range(100000))
+
+    with Profiler(memory=True) as profiler:
+        outer()
+    phases = {phase["name"]: phase for phase in profiler.phases}
+    assert (phases["inner"]["records"] == 100000 and phases["outer"]["records"] == 10)
+    assert (phases["inner"]["peak_bytes"] > 800000)
+    assert (phases["outer"]["peak_bytes"] >= phases["inner"]["peak_bytes"])
+
+
+def test_profiler_error():
+    """
+    A phase raising an error is recorded, without its number of records
+    """
+
+    @profiled("failing")
+    def failing(records):
+        raise ValueError("failing")
+
+    with Profiler() as profiler:
+        with pytest.raises(ValueError):
+            failing([1, 2])
+    assert (profiler.phases[0]["name"] == "failing" and "records" not in profiler.phases[0])
@@ -1,5 +1,6 @@
 import pytest
 
+from car_counter import CarCounter as CC
 from car_counter import Record as REC
 from datetime import datetime as DT
 
@@ -44,3 +45,49 @@ def test_Record_eq():
     assert (REC.from_string("2021-12-01T05:00:00 5") != REC.from_string("2021-01-01T05:00:00 5"))
     # Other type
     assert (REC.from_string("2021-12-01T05:00:00 5") != 5)
+
+
+def test_Record_lazy_timestamp():
+    """
+    The timestamp is stored in seconds, and the datetime built when read
+    """
+    record = REC.from_seconds(1638334800, 5)
+    assert (not hasattr(record, "__dict__"))
+    assert (record.seconds == 1638334800)
+    assert (record.timestamp == DT.fromisoformat("2021-12-01T05:00:00"))
+    assert (record == REC(DT.fromisoformat("2021-12-01T05:00:00"), 5))
+    assert (str(record) == "2021-12-01T05:00:00 5")
+    # Sub-seconds are kept by the datetime, and dropped by the seconds
+    record.timestamp = DT.fromisoformat("2021-12-01T05:30:00.250")
+    assert (record.seconds == 1638336600 and str(record) == "2021-12-01T05:30:00.250000 5")
+    assert (record != REC.from_seconds(1638336600, 5))
+
+
+def test_Record_aware_timestamp():
+    """
+    Aware datetimes are counted at their wall-clock time, and kept as is for the output and comparisons
+    """
+    record = REC.from_string("2021-12-01T05:00:00+01:00 5")
+    assert (record.seconds == 1638334800)
+    assert (record.timestamp == DT.fromisoformat("2021-12-01T04:00:00+00:00"))
+    assert (str(record) == "2021-12-01T05:00:00 5")
+    assert (record == REC(DT.fromisoformat("2021-12-01T04:00:00+00:00"), 5))
+    assert (record != REC.from_seconds(1638331200, 5))  # Aware and naive datetimes are never equal
+
+
+def test_Record_from_string_formats():
+    """
+    Other ISO 8601 formats are parsed as by parse_string
+    """
+    for string in ["2021-12-01T05:00:00 5", "2021-12-01T05:00 5", "2021-12-01 5", "20211201T050000 5"]:
+        record = REC.from_string(string)
+        assert (record == REC(*REC.parse_string(string)))
+        assert (record.seconds == 1638334800 or string == "2021-12-01 5")
+    with pytest.raises(ValueError):
+        REC.from_string("2021-13-01T05:00:00 5")
+    with pytest.raises(ValueError):
+        REC.from_string("2021-12-01T25:00:00 5")
+    # Grouped by their own date
+    early = [REC.from_string("2021-12-01T00:30:00+01:00 3"), REC.from_string("2021-12-01T01:00:00+01:00 4")]
+    assert (len(CC.group_by_date(early)) == 1)
+    assert (CC(early).get_count_by_date() == [("2021-12-01", 7)])
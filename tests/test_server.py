@@ -0,0 +1,81 @@
+import asyncio
+
+from car_counter import CarCounter as CC
+from server import CarCounterServer
+from streaming import StreamingCarCounter as SCC
+
+SEEK = "tests/fixtures/record_seek.txt"
+
+
+async def send(reader, writer, lines: list[str]) -> list[str]:
+    """ Send lines and read the answers until the connection is closed """
+    writer.write("".join(f"{line}\n" for line in lines).encode())
+    await writer.drain()
+    writer.write_eof()
+    answer = (await reader.read()).decode().splitlines()
+    writer.close()
+    return answer
+
+
+def test_server_execute():
+    """
+    Readings update the aggregates, queries answer from them
+    """
+    lines = open(SEEK).read().splitlines()
+    cc = CC.from_file(SEEK)
+    server = CarCounterServer()
+    assert (all(server.execute(line) == ["OK"] for line in lines))
+    assert (server.execute("TOTAL") == [str(cc.get_total_count())])
+    assert (server.execute("size") == [str(len(cc))])
+    assert (server.execute("DAYS") == [f"{date} {count}" for date, count in cc.get_count_by_date()] + ["END"])
+    assert (server.execute("TOP") == [str(record) for record in cc.get_top_n(3)] + ["END"])
+    assert (server.execute("TOP 1") == [str(record) for record in cc.get_top_n(1)] + ["END"])
+    assert (server.execute("LEAST") == [f"{p[0].timestamp} -- {p[-1].timestamp} {CC.total_count(p)}"
+                                        for p in cc.get_least_period(3)] + ["END"])
+    assert (server.execute("") == [])
+    # Errors do not change the aggregates
+    for line in ["2021-12-01T05:00:00 5", "2021-12-31T05:00:00", "2021-12-31T05:00:00 x", "2021-12-31T05:00:00+25:00 1",
+                 "TOP 4", "TOP x", "HELLO"]:
+        assert (server.execute(line)[0].startswith("ERROR"))
+    assert (server.execute("TOTAL") == [str(cc.get_total_count())])
+    # Readings with a time zone or sub-seconds
+    assert (server.execute("2021-12-31T05:00:00+01:00 1") == ["OK"])
+    assert (server.execute("2021-12-31T05:00:00.500 1") == ["OK"])
+    assert (server.execute("TOTAL") == [str(cc.get_total_count() + 2)])
+
+
+def test_server_tcp():
+    """
+    Many clients sending readings and queries on localhost
+    """
+    lines = open(SEEK).read().splitlines()
+
+    async def scenario():
+        server = CarCounterServer(SCC(top_n=3, period=3))
+        tcp = await server.start_tcp("127.0.0.1", 0)
+        host, port = tcp.sockets[0].getsockname()[:2]
+        first = await send(*await asyncio.open_connection(host, port), lines[:10] + ["TOTAL"])
+        second = await send(*await asyncio.open_connection(host, port), lines[10:] + ["TOTAL", "QUIT", "TOTAL"])
+        server.close()
+        return first, second
+
+    first, second = asyncio.run(scenario())
+    cc = CC.from_file(SEEK)
+    assert (first == ["OK"] * 10 + [str(CC.total_count(cc.records[:10]))])
+    assert (second == ["OK"] * (len(lines) - 10) + [str(cc.get_total_count()), "BYE"])
+
+
+def test_server_unix(tmp_path):
+    """
+    Serving on a Unix socket
+    """
+
+    async def scenario():
+        server = CarCounterServer()
+        await server.start_unix(str(tmp_path / "counter.sock"))
+        answer = await send(*await asyncio.open_unix_connection(str(tmp_path / "counter.sock")),
+                            ["2021-12-01T05:00:00 5", "2021-12-01T05:30:00 7", "TOTAL", "TOP 1"])
+        server.close()
+        return answer
+
+    assert (asyncio.run(scenario()) == ["OK", "OK", "12", "2021-12-01T05:30:00 7", "END"])
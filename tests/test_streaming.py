@@ -0,0 +1,170 @@
+import json
+
+import pytest
+
+from car_counter import CarCounter as CC
+from car_counter import Record as TS
+from conftest import assert_same_answers
+from streaming import StreamingCarCounter as SCC
+from streaming import TopN, update_checkpoint
+
+
+@pytest.fixture
+def record_seek():
+    """
+    Seek fixture (provided list of records), sorted by timestamp
+    :return: list of records
+    """
+    return CC.from_file("tests/fixtures/record_seek.txt").records
+
+
+def test_TopN():
+    """
+    Keep the items with the top n counts, with ties
+    """
+    top = TopN(3)
+    for i, count in enumerate([5, 50, 30, 40, 30, 0, 50]):
+        top.push(count, i)
+    assert (top.items() == [1, 6, 3])
+    assert (top.items(1) == [1, 6])
+    assert (top.items(0) == [])
+    top.push(40, 7)
+    assert (top.items() == [1, 6, 3, 7])
+    assert (len(top) == 4)
+    with pytest.raises(ValueError):
+        top.items(4)
+    # Ties at the bottom of the range
+    top = TopN(3)
+    for i, count in enumerate([50, 40, 30, 30, 5]):
+        top.push(count, i)
+    assert (top.items() == [0, 1, 2, 3])
+    # Merge
+    other = TopN(3)
+    other.push(45, 10)
+    top.merge(other)
+    assert (top.items() == [0, 10, 1])
+
+
+def test_SCC_matches_CC(record_seek):
+    """
+    A streaming counter gives the same answers as a CarCounter
+    """
+    cc = CC(record_seek)
+    for n in range(0, 6):
+        scc = SCC(top_n=5, period=n)
+        scc.consume(record_seek)
+        assert (scc.get_total_count() == cc.get_total_count() == 398)
+        assert (scc.get_count_by_date() == cc.get_count_by_date())
+        for k in range(0, 6):
+            assert (scc.get_top_n(k) == cc.get_top_n(k))
+        assert (scc.get_least_period() == cc.get_least_period(n))
+        assert (scc.get_least_period(n) == cc.get_least_period(n))
+
+
+def test_SCC_consume_chunks(record_seek):
+    """
+    Records can be streamed from chunks of text
+    """
+    text = open("tests/fixtures/record_seek.txt", "rb").read()
+    scc = SCC()
+    scc.consume_chunks(text[i:i + 10] for i in range(0, len(text), 10))
+    assert (scc.size == 24)
+    assert (scc.get_least_period() == CC(record_seek).get_least_period(3))
+    assert (scc.get_top_n() == CC(record_seek).get_top_n(3))
+
+
+def test_SCC_errors(record_seek):
+    """
+    Records must come in time order, and queries must fit the tracked sizes
+    """
+    scc = SCC(top_n=3, period=3)
+    with pytest.raises(ValueError):
+        scc.consume(reversed(record_seek))
+    with pytest.raises(ValueError):
+        scc.get_top_n(4)
+    with pytest.raises(ValueError):
+        scc.get_least_period(2)
+    # Ties on the timestamp are accepted
+    scc = SCC(top_n=3, period=3)
+    scc.consume([TS.from_string("2021-12-01T05:00:00 5"), TS.from_string("2021-12-01T05:00:00 6")])
+    assert (scc.get_total_count() == 11)
+
+
+def test_SCC_consume_files(tmp_path, record_seek):
+    """
+    Sorted files merged while streaming them
+    """
+    lines = open("tests/fixtures/record_seek.txt").read().splitlines()
+    (tmp_path / "a.txt").write_text("\n".join(lines[::3]))
+    (tmp_path / "b.txt").write_text("\n".join(lines[1::3]))
+    (tmp_path / "c.txt").write_text("\n".join(lines[2::3]))
+    scc = SCC(top_n=3, period=3)
+    scc.consume_files([tmp_path / "c.txt", tmp_path / "a.txt", tmp_path / "b.txt"])
+    cc = CC(record_seek)
+    assert (scc.get_total_count() == cc.get_total_count())
+    assert (scc.get_count_by_date() == cc.get_count_by_date())
+    assert (scc.get_top_n() == cc.get_top_n(3))
+    assert (scc.get_least_period() == cc.get_least_period(3))
+    (tmp_path / "d.txt").write_text("\n".join(reversed(lines)))
+    with pytest.raises(ValueError):
+        SCC().consume_files([tmp_path / "d.txt"])
+
+
+def test_SCC_state(record_seek):
+    """
+    A counter rebuilt from its state (through JSON) goes on as the original one
+    """
+    for cut in [0, 1, 2, 10, 23, 24]:
+        for period in range(0, 5):
+            scc = SCC(top_n=5, period=period)
+            scc.consume(record_seek[:cut])
+            restored = SCC.from_state(json.loads(json.dumps(scc.state())))
+            restored.consume(record_seek[cut:])
+            assert_same_answers(restored, CC(record_seek))
+    with pytest.raises(ValueError):
+        SCC.from_state({"version": 0})
+
+
+def test_update_checkpoint(tmp_path):
+    """
+    Only the records appended since the previous checkpoint are parsed, with the same answers as the whole file
+    """
+    text = open("tests/fixtures/record_seek.txt", "rb").read()
+    path = tmp_path / "records.txt"
+    checkpoint = tmp_path / "records.txt.checkpoint"
+    # Appended by pieces, some of them ending on an incomplete line (read, but parsed again next time)
+    ends = [i for i, byte in enumerate(text) if byte == ord("\n")]
+    path.write_bytes(b"")
+    for stop in [0, ends[0], ends[0] + 1, ends[3], ends[4] - 1, ends[10] + 1, ends[-1], len(text), len(text)]:
+        with open(path, "ab") as file:
+            file.write(text[path.stat().st_size:stop])
+        assert_same_answers(update_checkpoint(path), CC.from_file(path))
+        assert (json.loads(checkpoint.read_text())["offset"] == text.rfind(b"\n", 0, stop) + 1)
+    # The records before the offset are not parsed again: a bogus state shows
+    state = json.loads(checkpoint.read_text())
+    state["counter"]["total"] += 1000
+    checkpoint.write_text(json.dumps(state))
+    assert (update_checkpoint(path).get_total_count() == CC.from_file(path).get_total_count() + 1000)
+    # Rewritten file, other questions, or invalid checkpoint: read again from the start
+    path.write_bytes(text.replace(b"2021-12-01T05:00:00 5", b"2021-12-01T05:00:00 9"))
+    assert_same_answers(update_checkpoint(path), CC.from_file(path))
+    assert_same_answers(update_checkpoint(path, top_n=4, period=2), CC.from_file(path))
+    checkpoint.write_text("{")
+    assert_same_answers(update_checkpoint(path), CC.from_file(path))
+    # Half-written last lines are left out of the answers, and parsed again once complete
+    with open(path, "ab") as file:
+        file.write(b"\n")
+    complete = CC.from_file(path)
+    written = path.stat().st_size
+    for partial in [b"2021-12-09T06:0", b"2021-12-09T06:00:00", b"2021-12-09T06:00:00 "]:
+        with open(path, "ab") as file:
+            file.write(partial[path.stat().st_size - written:])
+        assert_same_answers(update_checkpoint(path), complete)
+    with open(path, "ab") as file:
+        file.write(b"7\n")
+    assert_same_answers(update_checkpoint(path), CC.from_file(path))
+    # Appended records must come after the previous ones
+    with open(path, "ab") as file:
+        file.write(b"2021-12-01T05:00:00 5\n")
+    with pytest.raises(ValueError, match="time order"):
+        update_checkpoint(path)
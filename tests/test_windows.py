@@ -0,0 +1,86 @@
+import random
+
+from car_counter import CarCounter as CC
+from windows import get_busiest_period, get_top_windows, rolling_max, rolling_mean, rolling_min, rolling_sum
+
+SEEK = "tests/fixtures/record_seek.txt"
+
+
+def brute_windows(cc, n):
+    """ (start index, sum) of every window of n contiguous records """
+    return [(i, sum(cc.counts[i:i + n])) for start, stop in cc.contiguity_ranges() for i in range(start, stop - n + 1)]
+
+
+def brute_top_windows(cc, n, k, largest):
+    windows = sorted(brute_windows(cc, n), key=lambda w: (-w[1] if largest else w[1], w[0]))
+    taken = []
+    for start, count in windows:
+        if len(taken) >= k and count != taken[-1][1]:
+            break
+        if all(abs(start - other) >= n for other, _ in taken):
+            taken.append((start, count))
+    return [[cc._record(i) for i in range(start, start + n)] for start, _ in sorted(taken)]
+
+
+def random_counter(seed):
+    rng = random.Random(seed)
+    timestamps = []
+    timestamp = 0
+    for _ in range(rng.randint(0, 60)):
+        timestamp += 1800 * rng.choice([1, 1, 1, 1, 2, 3])
+        timestamps.append(timestamp)
+    return CC.from_columns(timestamps, [rng.randint(0, 5) for _ in timestamps])
+
+
+def test_busiest_period():
+    """
+    Periods with the most cars, including ties
+    """
+    cc = CC.from_file(SEEK)
+    busiest = get_busiest_period(cc, 3)
+    assert ([[str(record) for record in period] for period in busiest] ==
+            [["2021-12-01T07:00:00 25", "2021-12-01T07:30:00 46", "2021-12-01T08:00:00 42"]])
+    assert (get_busiest_period(cc, 0) == [] and get_busiest_period(CC(), 3) == [])
+    for seed in range(50):
+        cc = random_counter(seed)
+        for n in range(1, 5):
+            windows = brute_windows(cc, n)
+            best = max((count for _, count in windows), default=None)
+            expected = [[cc._record(i) for i in range(start, start + n)] for start, count in windows if count == best]
+            assert (get_busiest_period(cc, n) == expected)
+            # The quietest windows are least periods, the ones not overlapping
+            least = cc.get_least_period(n)
+            assert (all(period in least for period in get_top_windows(cc, n, 1, largest=False)))
+            assert (least[:1] == get_top_windows(cc, n, 1, largest=False)[:1])
+
+
+def test_top_windows():
+    """
+    k best windows that do not overlap, including ties
+    """
+    cc = CC.from_columns(range(0, 1800 * 9, 1800), [1, 9, 1, 1, 8, 8, 1, 0, 0])
+    assert ([[r.car_count for r in period] for period in get_top_windows(cc, 2, 2)] == [[1, 9], [8, 8]])
+    assert ([[r.car_count for r in period] for period in get_top_windows(cc, 2, 2, largest=False)] ==
+            [[1, 1], [0, 0]])
+    assert (get_top_windows(cc, 0, 2) == [] and get_top_windows(cc, 2, 0) == [])
+    for seed in range(50):
+        cc = random_counter(seed)
+        for n in range(1, 5):
+            for k in range(1, 5):
+                for largest in [True, False]:
+                    assert (get_top_windows(cc, n, k, largest) == brute_top_windows(cc, n, k, largest))
+
+
+def test_rolling():
+    """
+    Rolling sums, means, maximums and minimums, not spanning gaps
+    """
+    for seed in range(50):
+        cc = random_counter(seed)
+        for n in range(0, 5):
+            windows = brute_windows(cc, n) if n > 0 else []
+            starts = [cc.timestamps[i] for i, _ in windows]
+            assert (tuple(map(list, rolling_sum(cc, n))) == (starts, [count for _, count in windows]))
+            assert (tuple(map(list, rolling_mean(cc, n))) == (starts, [count / n for _, count in windows]))
+            assert (tuple(map(list, rolling_max(cc, n))) == (starts, [max(cc.counts[i:i + n]) for i, _ in windows]))
+            assert (tuple(map(list, rolling_min(cc, n))) == (starts, [min(cc.counts[i:i + n]) for i, _ in windows]))
@@ -0,0 +1,159 @@
+from array import array
+from bisect import bisect_left, insort
+from collections import deque
+from heapq import nlargest, nsmallest
+from itertools import chain, compress, repeat
+from operator import eq, ge, le, truediv
+from typing import Iterator
+
+from car_counter import CarCounter, Record
+
+
+def _window_starts(counter: CarCounter, n: int) -> Iterator[int]:
+    """ Index of the first record of every window, in time order """
+    return chain.from_iterable(range(start, stop - n + 1) for start, stop in counter.contiguity_ranges())
+
+
+def _window_sums(counter: CarCounter, n: int) -> Iterator[int]:
+    """ Sum of every window, aligned with _window_starts """
+    return chain.from_iterable(CarCounter.window_sums(counter.counts, start, stop, n)
+                               for start, stop in counter.contiguity_ranges())
+
+
+def _periods(counter: CarCounter, starts, n: int) -> list[list[Record]]:
+    return [[counter._record(i) for i in range(start, start + n)] for start in starts]
+
+
+def get_busiest_period(counter: CarCounter, n: int) -> list[list[Record]]:
+    """
+    Periods of n contiguous records with the most cars, including ties (the counterpart of get_least_period)
+
+    :param counter: a CarCounter
+    :param n: number of records of the periods
+    :return: a list of periods in time order, each one being a list of records
+    """
+    if n <= 0:
+        return []
+    # First pass: largest window. Second pass: where it occurs.
+    best = max(_window_sums(counter, n), default=None)
+    if best is None:
+        return []
+    return _periods(counter, compress(_window_starts(counter, n), map(eq, _window_sums(counter, n), repeat(best))), n)
+
+
+def get_top_windows(counter: CarCounter, n: int, k: int, largest: bool = True) -> list[list[Record]]:
+    """
+    The k busiest (or quietest) periods of n contiguous records that do not overlap, including ties.
+    Windows are taken greedily, from the best one: a window is taken unless it overlaps a window already taken,
+    until k windows are taken; the next windows with the same number of cars as the k-th one are also taken
+    if they do not overlap.
+
+    As a window overlaps at most 2n-1 windows (itself included), the k windows are found within the
+    k(2n-1) best windows (and their ties), selected with a heap: O(N log(kn)).
+
+    :param counter: a CarCounter
+    :param n: number of records of the periods
+    :param k: number of periods
+    :param largest: the busiest periods if True, the quietest otherwise
+    :return: a list of periods in time order, each one being a list of records
+    """
+    if n <= 0 or k <= 0:
+        return []
+    pool = (nlargest if largest else nsmallest)(k * (2 * n - 1), _window_sums(counter, n))
+    if not pool:
+        return []
+    selected = map(ge if largest else le, _window_sums(counter, n), repeat(pool[-1]))
+    candidates = list(compress(zip(_window_sums(counter, n), _window_starts(counter, n)), selected))
+    # Best first, then time order
+    candidates.sort(key=(lambda candidate: (-candidate[0], candidate[1])) if largest else None)
+
+    taken: list[int] = []  # Starts of the windows taken, sorted
+    last_count = None
+    for count, start in candidates:
+        if len(taken) >= k and count != last_count:
+            break
+        # Windows have the same size: they overlap when their starts are less than n records apart
+        position = bisect_left(taken, start)
+        if position > 0 and start - taken[position - 1] < n:
+            continue
+        if position < len(taken) and taken[position] - start < n:
+            continue
+        insort(taken, start)
+        last_count = count
+    return _periods(counter, taken, n)
+
+
+def rolling_sum(counter: CarCounter, n: int) -> tuple[array, array]:
+    """
+    Number of cars of every window of n contiguous records, computed as a running sum
+
+    :param counter: a CarCounter
+    :param n: number of records of the windows
+    :return: a tuple of columns (timestamp of the first record of the windows, number of cars)
+    """
+    if n <= 0:
+        return array("q"), array("q")
+    timestamps = counter.timestamps
+    return array("q", map(timestamps.__getitem__, _window_starts(counter, n))), array("q", _window_sums(counter, n))
+
+
+def rolling_mean(counter: CarCounter, n: int) -> tuple[array, array]:
+    """
+    Mean number of cars per record of every window of n contiguous records
+
+    :param counter: a CarCounter
+    :param n: number of records of the windows
+    :return: a tuple of columns (timestamp of the first record of the windows, mean as a float)
+    """
+    starts, sums = rolling_sum(counter, n)
+    return starts, array("d", map(truediv, sums, repeat(n)))
+
+
+def rolling_max(counter: CarCounter, n: int) -> tuple[array, array]:
+    """
+    Largest count of every window of n contiguous records, computed with a monotonic deque in O(N)
+
+    :param counter: a CarCounter
+    :param n: number of records of the windows
+    :return: a tuple of columns (timestamp of the first record of the windows, largest count)
+    """
+    return _rolling_extreme(counter, n, largest=True)
+
+
+def rolling_min(counter: CarCounter, n: int) -> tuple[array, array]:
+    """
+    Smallest count of every window of n contiguous records, computed with a monotonic deque in O(N)
+
+    :param counter: a CarCounter
+    :param n: number of records of the windows
+    :return: a tuple of columns (timestamp of the first record of the windows, smallest count)
+    """
+    return _rolling_extreme(counter, n, largest=False)
+
+
+def _rolling_extreme(counter: CarCounter, n: int, largest: bool) -> tuple[array, array]:
+    starts = array("q")
+    extremes = array("q")
+    if n <= 0:
+        return starts, extremes
+    timestamps = counter.timestamps
+    counts = counter.counts
+    for start, stop in counter.contiguity_ranges():
+        # Indexes of the window whose counts are strictly decreasing (increasing for the smallest):
+        # the first one is the extreme of the window, the next ones are the candidates once it leaves the window
+        window: deque[int] = deque()
+        for i in range(start, stop):
+            count = counts[i]
+            if largest:
+                while window and counts[window[-1]] <= count:
+                    window.pop()
+            else:
+                while window and counts[window[-1]] >= count:
+                    window.pop()
+            window.append(i)
+            if window[0] <= i - n:
+                window.popleft()
+            if i - start >= n - 1:
+                starts.append(timestamps[i - n + 1])
+                extremes.append(counts[window[0]])
+    return starts, extremes